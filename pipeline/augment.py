@@ -0,0 +1,160 @@
+import os
+import sys
+import numpy as np
+
+# Permitir ejecutar el script directamente (python pipeline/augment.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from pipeline.lector import LAYOUT
+
+def mirror(batch):
+    """
+    Espejo izquierda/derecha: intercambia los slots Right/Left y refleja x (x -> 1 - x)
+    de las manos presentes. La cara se deja tal cual: reflejarla exigiría permutar los
+    468 índices de la malla a sus simétricos, y reflejar solo x daría una malla que
+    FaceMesh nunca produce.
+    """
+    out = np.array(batch, dtype=np.float32)
+    hands = LAYOUT.hands(out)
+    hand_present = LAYOUT.hand_presence(out)
+    hands[:] = hands[:, ::-1].copy()
+    hand_present = hand_present[:, ::-1]
+    hands[..., 0] = np.where(hand_present[:, :, None], 1.0 - hands[..., 0], 0.0)
+    return out
+
+def rotate_scale(batch, rng, max_angle=15.0, max_scale=0.1, aspect=1.0):
+    """
+    Rota cada mano presente un ángulo aleatorio de ±`max_angle` grados y la escala un
+    factor 1 ± `max_scale` alrededor de su muñeca (landmark 0). Cada frame recibe su
+    propio ángulo y escala, compartidos por sus dos manos. z se escala igual que x/y.
+    x e y están normalizadas por el ancho y el alto del frame: `aspect` (ancho / alto
+    del vídeo de origen) las lleva a la misma escala antes de rotar.
+    """
+    out = np.array(batch, dtype=np.float32)
+    hands = LAYOUT.hands(out)
+    hand_present = LAYOUT.hand_presence(out)
+    n = len(out)
+    angle = np.deg2rad(rng.uniform(-max_angle, max_angle, n)).astype(np.float32)
+    scale = rng.uniform(1 - max_scale, 1 + max_scale, n).astype(np.float32)
+    cos, sin = (np.cos(angle) * scale)[:, None, None], (np.sin(angle) * scale)[:, None, None]
+    wrist = hands[:, :, :1, :3].copy()
+    dx = (hands[..., 0] - wrist[..., 0]) * aspect
+    dy = hands[..., 1] - wrist[..., 1]
+    mask = hand_present[:, :, None]
+    hands[..., 0] = np.where(mask, wrist[..., 0] + (cos * dx - sin * dy) / aspect, 0.0)
+    hands[..., 1] = np.where(mask, wrist[..., 1] + sin * dx + cos * dy, 0.0)
+    hands[..., 2] = np.where(mask, hands[..., 2] * scale[:, None, None], 0.0)
+    return out
+
+def jitter(batch, rng, sigma=0.003):
+    """
+    Ruido gaussiano de desviación `sigma` en las coordenadas de las manos y la cara
+    presentes; las ausentes siguen a cero y las banderas de presencia no cambian.
+    """
+    out = np.array(batch, dtype=np.float32)
+    hands, face = LAYOUT.hands(out), LAYOUT.face(out)
+    hand_present, face_present = LAYOUT.hand_presence(out), LAYOUT.face_presence(out)
+    hands[..., :3] += rng.normal(0.0, sigma, hands[..., :3].shape).astype(np.float32) * hand_present[:, :, None, None]
+    face += rng.normal(0.0, sigma, face.shape).astype(np.float32) * face_present[:, None, None]
+    return out
+
+def time_warp(clip, rng, max_warp=0.2, knots=4):
+    """
+    Cambia el ritmo de un clip (frames, 1572) con una deformación temporal monótona
+    y suave: la velocidad varía ±`max_warp` entre `knots` puntos de control, y el clip
+    conserva su número de frames. Cada frame nuevo interpola linealmente sus dos
+    vecinos; si una mano o la cara solo está presente en uno de ellos se toma el más
+    cercano en lugar de mezclar con ceros.
+    """
+    clip = np.asarray(clip, dtype=np.float32)
+    n = len(clip)
+    if n < 2:
+        return clip.copy()
+    speed = np.interp(np.linspace(0, knots - 1, n - 1), np.arange(knots),
+                      rng.uniform(1 - max_warp, 1 + max_warp, knots))
+    t = np.concatenate([[0.0], np.cumsum(speed)])
+    t *= (n - 1) / t[-1]
+    i0 = np.minimum(np.floor(t).astype(int), n - 2)
+    w = (t - i0).astype(np.float32)[:, None]
+    a, b = clip[i0], clip[i0 + 1]
+    out = (1 - w) * a + w * b
+    nearest = np.where(w < 0.5, a, b)
+    mixed = LAYOUT.hand_presence(a) != LAYOUT.hand_presence(b)
+    LAYOUT.hands(out)[mixed] = LAYOUT.hands(nearest)[mixed]
+    mixed = LAYOUT.face_presence(a) != LAYOUT.face_presence(b)
+    LAYOUT.face(out)[mixed] = LAYOUT.face(nearest)[mixed]
+    return out
+
+def augment_clip(clip, rng, mirror_prob=0.5, max_angle=15.0, max_scale=0.1, sigma=0.003, max_warp=0.2,
+                 aspect=1.0):
+    """
+    Una variante aumentada de un clip completo: deformación temporal, espejo (con
+    probabilidad `mirror_prob`, para todo el clip), rotación/escala y ruido.
+    Con un parámetro a 0 se omite esa transformación. `aspect`: ver rotate_scale.
+    """
+    out = time_warp(clip, rng, max_warp) if max_warp else np.array(clip, dtype=np.float32)
+    if mirror_prob and rng.random() < mirror_prob:
+        out = mirror(out)
+    if max_angle or max_scale:
+        out = rotate_scale(out, rng, max_angle, max_scale, aspect)
+    if sigma:
+        out = jitter(out, rng, sigma)
+    return out
+
+def augmented_batches(clips, batches, batch_size=4096, seed=0, aspect=1.0, **augment_kwargs):
+    """
+    Genera `batches` lotes (X, y) de unos `batch_size` frames aumentados sobre la
+    marcha a partir de `clips`, lista de (frames, etiqueta) o (frames, etiqueta,
+    aspecto ancho/alto del vídeo de origen) con frames en memmap; sin aspecto se usa
+    `aspect`.
+    Cada lote tiene el mismo número de frames de cada clase (todas las clases en
+    todos los lotes) sacados de variantes aumentadas de clips al azar. En memoria
+    solo están el lote en curso y el clip que se aumenta, sea cual sea el dataset.
+    Sin deformación temporal: los frames se barajan, así que el ritmo del clip no llega
+    al clasificador por frame (para secuencias, ver augment_clip en train_sequence).
+    """
+    by_class = {}
+    for frames, label, *clip_aspect in clips:
+        if len(frames):
+            by_class.setdefault(str(label), []).append((frames, clip_aspect[0] if clip_aspect else aspect))
+    if not by_class:
+        raise ValueError("No hay clips con frames que aumentar")
+    classes = sorted(by_class)
+    per_class = max(1, batch_size // len(classes))
+    rng = np.random.default_rng(seed)
+    augment_kwargs['max_warp'] = 0
+    num_features = clips[0][0].shape[1]
+    for _ in range(batches):
+        X = np.empty((per_class * len(classes), num_features), dtype=np.float32)
+        y = np.repeat(np.array(classes), per_class)
+        row = 0
+        for label in classes:
+            end = row + per_class
+            while row < end:
+                source, source_aspect = by_class[label][rng.integers(len(by_class[label]))]
+                variant = augment_clip(source, rng, aspect=source_aspect, **augment_kwargs)
+                take = min(end - row, len(variant))
+                X[row:row + take] = variant[rng.permutation(len(variant))[:take]]
+                row += take
+        yield X, y
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from pipeline.dataset import labeled_clips
+    parser = argparse.ArgumentParser(description='Genera lotes aumentados y muestra su coste (sin escribir nada).')
+    parser.add_argument('--features_dir', default='output', help='Directorio con los .npy por clip')
+    parser.add_argument('--labels', default='data/labels.json', help='Archivo JSON de etiquetas')
+    parser.add_argument('--batches', type=int, default=5, help='Número de lotes')
+    parser.add_argument('--batch_size', type=int, default=4096, help='Frames por lote')
+    args = parser.parse_args()
+    resolve = lambda p: p if os.path.isabs(p) else os.path.join(project_root, p)
+    clips = [(frames, label) for _, frames, label in labeled_clips(resolve(args.features_dir), resolve(args.labels))]
+    start = time.perf_counter()
+    total = 0
+    for X, y in augmented_batches(clips, args.batches, args.batch_size):
+        total += len(X)
+    elapsed = time.perf_counter() - start
+    print(f"{total} frames aumentados en {elapsed:.2f}s ({total / elapsed:.0f} frames/s)")
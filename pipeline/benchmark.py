@@ -0,0 +1,284 @@
+import cv2
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Permitir ejecutar el script directamente (python pipeline/benchmark.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.capture import KeypointExtractor, NUM_FEATURES, draw_keypoints, landmarks_to_array, pack_keypoints
+from src.model import GestureClassifier
+
+# Etapas en el orden del pipeline; 'extract' es KeypointExtractor.extract completo
+STAGES = ('decode', 'convert', 'hands', 'face', 'pack', 'draw', 'extract', 'predict', 'encode')
+
+def current_rss_mb():
+    """
+    Memoria residente actual del proceso en MB (None si no se puede medir).
+    Lee /proc/self/statm en Linux y usa `psutil`, si está instalado, en el resto.
+    A diferencia del pico (ru_maxrss), baja cuando se libera memoria, así que
+    sirve para atribuir a cada etapa la memoria que retiene.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+class StageTimer:
+    """
+    Acumula la duración de cada llamada de una etapa y resume throughput,
+    percentiles de latencia y la memoria residente: la actual al terminar la etapa
+    y su variación desde la primera llamada (lo que la etapa deja retenido).
+    """
+    def __init__(self):
+        self.samples = {}
+        self.rss_start = {}
+        self.rss = {}
+
+    def time(self, stage, fn, *args):
+        if stage not in self.rss_start:
+            self.rss_start[stage] = current_rss_mb()
+        start = time.perf_counter()
+        result = fn(*args)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def done(self, stage):
+        self.rss[stage] = current_rss_mb()
+
+    def _delta(self, stage):
+        before, after = self.rss_start.get(stage), self.rss.get(stage)
+        return None if before is None or after is None else after - before
+
+    def summary(self) -> dict:
+        report = {}
+        for stage in STAGES:
+            times = self.samples.get(stage)
+            if not times:
+                continue
+            ms = np.asarray(times) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            report[stage] = {
+                'calls': len(ms),
+                'throughput_per_s': float(len(ms) / (ms.sum() / 1000)) if ms.sum() else None,
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'rss_mb': self.rss.get(stage),
+                'rss_delta_mb': self._delta(stage),
+            }
+        return report
+
+def clip_frames(clips_dir: str, max_frames: int, timer: StageTimer) -> list:
+    """
+    Decodifica (midiendo 'decode') hasta `max_frames` frames de los .avi de `clips_dir`.
+    """
+    frames = []
+    for fname in sorted(os.listdir(clips_dir)):
+        if not fname.lower().endswith('.avi'):
+            continue
+        cap = cv2.VideoCapture(os.path.join(clips_dir, fname))
+        while len(frames) < max_frames:
+            ret, frame = timer.time('decode', cap.read)
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        if len(frames) >= max_frames:
+            break
+    timer.done('decode')
+    return frames
+
+def synthetic_frames(n: int, width: int = 640, height: int = 480, seed: int = 0) -> list:
+    """
+    Frames deterministas (degradado de fondo + rectángulos) para medir sin clips ni webcam.
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 255 // width, yy * 255 // height, (xx + yy) * 255 // (width + height)], axis=-1)
+    frames = []
+    for _ in range(n):
+        frame = base.astype(np.uint8).copy()
+        for _ in range(5):
+            x, y = rng.integers(0, width - 80), rng.integers(0, height - 80)
+            frame[y:y + 80, x:x + 80] = rng.integers(0, 256, size=3)
+        frames.append(frame)
+    return frames
+
+def synthetic_classifier(model_path: str, num_classes: int = 5, samples: int = 500) -> GestureClassifier:
+    """
+    GestureClassifier entrenado con datos aleatorios: mismo tamaño de vector y tipo de
+    modelo que el real, para medir predict cuando no hay un modelo entrenado.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.random((samples, NUM_FEATURES), dtype=np.float32)
+    y = np.array([chr(ord('A') + i % num_classes) for i in range(samples)])
+    classifier = GestureClassifier(model_path=model_path)
+    classifier.train(X, y)
+    return classifier
+
+def run_stages(frames: list, extractor: KeypointExtractor, classifier: GestureClassifier,
+               timer: StageTimer, encode_path: str) -> None:
+    """
+    Mide cada etapa por separado sobre todos los `frames`, en el orden del pipeline.
+    """
+    rgb = [timer.time('convert', cv2.cvtColor, f, cv2.COLOR_BGR2RGB) for f in frames]
+    timer.done('convert')
+    # La primera llamada a cada grafo inicializa MediaPipe: se descarta
+    extractor.hands.process(rgb[0])
+    hands = [timer.time('hands', extractor.hands.process, image) for image in rgb]
+    timer.done('hands')
+    extractor.face.process(rgb[0])
+    faces = [timer.time('face', extractor.face.process, image) for image in rgb]
+    timer.done('face')
+
+    def pack(res_hands, res_face, out):
+        face = None
+        if res_face.multi_face_landmarks:
+            face = landmarks_to_array(res_face.multi_face_landmarks[0])
+        return pack_keypoints(extractor._parse_hands(res_hands), face, out)
+
+    features = np.empty((len(frames), NUM_FEATURES), dtype=np.float32)
+    for i, (res_hands, res_face) in enumerate(zip(hands, faces)):
+        timer.time('pack', pack, res_hands, res_face, features[i])
+    timer.done('pack')
+    for frame, kp in zip(frames, features):
+        timer.time('draw', draw_keypoints, frame.copy(), kp)
+    timer.done('draw')
+    extractor.reset()
+    for i, frame in enumerate(frames):
+        timer.time('extract', extractor.extract, frame, False, features[i])
+    timer.done('extract')
+    classifier.predict(features[0])
+    for kp in features:
+        timer.time('predict', classifier.predict, kp)
+    timer.done('predict')
+    h, w = frames[0].shape[:2]
+    writer = cv2.VideoWriter(encode_path, cv2.VideoWriter_fourcc(*'XVID'), 20.0, (w, h))
+    for frame in frames:
+        timer.time('encode', writer.write, frame)
+    writer.release()
+    timer.done('encode')
+
+def run_benchmark(
+    clips_dir: str = None,
+    synthetic: int = 100,
+    max_frames: int = 300,
+    model_path: str = None,
+    extractor_kwargs: dict = None
+) -> dict:
+    """
+    Ejecuta las etapas sobre los clips de `clips_dir` (si se indica) y sobre
+    `synthetic` frames sintéticos. Devuelve el informe por fuente y etapa.
+    """
+    extractor = KeypointExtractor(**(extractor_kwargs or {}))
+    with tempfile.TemporaryDirectory() as tmp:
+        if model_path and os.path.isfile(model_path):
+            classifier = GestureClassifier(model_path=model_path)
+            classifier.load()
+        else:
+            classifier = synthetic_classifier(os.path.join(tmp, 'model.joblib'))
+            model_path = None
+        sources = {}
+        if clips_dir:
+            timer = StageTimer()
+            frames = clip_frames(clips_dir, max_frames, timer)
+            if frames:
+                run_stages(frames, extractor, classifier, timer, os.path.join(tmp, 'clips.avi'))
+                sources['clips'] = {'frames': len(frames), 'stages': timer.summary()}
+            else:
+                print(f"⚠️  No hay clips .avi en {clips_dir}")
+        if synthetic:
+            timer = StageTimer()
+            run_stages(synthetic_frames(synthetic), extractor, classifier, timer, os.path.join(tmp, 'synthetic.avi'))
+            sources['synthetic'] = {'frames': synthetic, 'stages': timer.summary()}
+    extractor.close()
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'model': model_path or 'sintético',
+            'extractor': extractor.settings,
+        },
+        'sources': sources,
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    Compara dos informes y devuelve la lista de regresiones: etapas cuya latencia
+    p50 o p95 crece, o cuyo throughput cae, más de `tolerance` (fracción).
+    """
+    regressions = []
+    for source, current in report['sources'].items():
+        base = baseline.get('sources', {}).get(source)
+        if not base:
+            continue
+        for stage, now in current['stages'].items():
+            ref = base['stages'].get(stage)
+            if not ref:
+                continue
+            for key in ('p50_ms', 'p95_ms'):
+                if ref[key] and now[key] > ref[key] * (1 + tolerance):
+                    regressions.append(f"{source}/{stage}: {key} {ref[key]:.2f} -> {now[key]:.2f}")
+            if ref['throughput_per_s'] and now['throughput_per_s'] < ref['throughput_per_s'] / (1 + tolerance):
+                regressions.append(f"{source}/{stage}: throughput {ref['throughput_per_s']:.1f}/s "
+                                   f"-> {now['throughput_per_s']:.1f}/s")
+    return regressions
+
+def print_report(report: dict) -> None:
+    fmt = lambda v, spec: format(v, spec) if v is not None else '-'
+    for source, result in report['sources'].items():
+        print(f"\n{source} ({result['frames']} frames)")
+        print(f"{'etapa':<10}{'llamadas/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS MB':>9}{'Δ RSS MB':>10}")
+        for stage, r in result['stages'].items():
+            print(f"{stage:<10}{fmt(r['throughput_per_s'], '.1f'):>12}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+                  f"{r['p99_ms']:>10.2f}{fmt(r['rss_mb'], '.0f'):>9}{fmt(r['rss_delta_mb'], '+.1f'):>10}")
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark por etapas de la extracción y el reconocimiento (sin webcam).')
+    parser.add_argument('--clips_dir', default='data/clips', help='Directorio con clips brutos (.avi)')
+    parser.add_argument('--no_clips', action='store_true', help='Medir solo con frames sintéticos')
+    parser.add_argument('--synthetic', type=int, default=100, help='Número de frames sintéticos (0 = ninguno)')
+    parser.add_argument('--max_frames', type=int, default=300, help='Máximo de frames a leer de los clips')
+    parser.add_argument('--model', default='src/model.joblib',
+                        help='Modelo para medir predict (si no existe se usa uno sintético)')
+    parser.add_argument('--out', default='output/benchmark.json', help='Ruta del informe JSON')
+    parser.add_argument('--baseline', default=None, help='Informe JSON anterior con el que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Empeoramiento relativo permitido frente a la referencia')
+    args = parser.parse_args()
+    resolve = lambda p: p if p is None or os.path.isabs(p) else os.path.join(project_root, p)
+
+    report = run_benchmark(None if args.no_clips else resolve(args.clips_dir), args.synthetic,
+                           args.max_frames, resolve(args.model))
+    print_report(report)
+    out_path = resolve(args.out)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nInforme guardado en {out_path}")
+    if args.baseline:
+        with open(resolve(args.baseline), 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regresiones frente a {args.baseline}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"Sin regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%})")
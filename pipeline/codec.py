@@ -0,0 +1,204 @@
+import os
+import sys
+import numpy as np
+
+# Permitir ejecutar el script directamente (python pipeline/codec.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from pipeline.lector import LAYOUT, FeatureLayout
+
+CODEC_VERSION = 1
+EXTENSION = '.kpz'
+# Extensiones de features por clip que entienden los lectores del pipeline
+FEATURE_EXTENSIONS = ('.npy', EXTENSION)
+PRECISIONS = ('u16', 'f16')
+_QMAX = np.iinfo(np.uint16).max
+
+def face_subset(spec) -> np.ndarray:
+    """
+    Índices de landmarks faciales a conservar. `spec` puede ser None (todos),
+    una lista de índices, un texto '1,2,3' o 'contorno' (óvalo, cejas, ojos y labios
+    según las conexiones de FaceMesh de MediaPipe).
+    """
+    if spec is None:
+        return None
+    if isinstance(spec, str):
+        if spec == 'contorno':
+            from mediapipe.python.solutions import face_mesh_connections as fmc
+            edges = (fmc.FACEMESH_FACE_OVAL | fmc.FACEMESH_LIPS | fmc.FACEMESH_LEFT_EYE
+                     | fmc.FACEMESH_RIGHT_EYE | fmc.FACEMESH_LEFT_EYEBROW | fmc.FACEMESH_RIGHT_EYEBROW)
+            spec = {i for edge in edges for i in edge}
+        else:
+            spec = [int(i) for i in spec.split(',') if i.strip()]
+    return np.unique(np.asarray(list(spec), dtype=np.int16))
+
+def _presence_bits(num_hands: int) -> np.ndarray:
+    # Un bit por slot de mano y uno más para la cara
+    return (1 << np.arange(num_hands + 1)).astype(np.uint8)
+
+def _quantize(values: np.ndarray, precision: str) -> tuple:
+    """
+    Cuantiza `values` (..., 3). Con 'u16' cada coordenada se lleva a [0, 65535] con su
+    propio rango [min, max] del clip (error máximo: rango/131070); con 'f16' se
+    guarda en media precisión y el rango no se usa.
+    """
+    if precision == 'f16':
+        return values.astype(np.float16), np.zeros((2, 3), dtype=np.float32)
+    if not len(values):
+        return values.astype(np.uint16), np.zeros((2, 3), dtype=np.float32)
+    flat = values.reshape(-1, 3)
+    lo, hi = flat.min(axis=0), flat.max(axis=0)
+    scale = np.where(hi > lo, (hi - lo) / _QMAX, 1.0)
+    q = np.rint((values - lo) / scale).astype(np.uint16)
+    return q, np.stack([lo, scale]).astype(np.float32)
+
+def _dequantize(q: np.ndarray, qrange: np.ndarray) -> np.ndarray:
+    if q.dtype == np.float16:
+        return q.astype(np.float32)
+    return q.astype(np.float32) * qrange[1] + qrange[0]
+
+def encode(frames: np.ndarray, layout: FeatureLayout = LAYOUT, face_index=None, precision: str = 'u16') -> dict:
+    """
+    Codifica un clip (frames, num_features) en arrays compactos:
+    - presence: máscara de bits por frame (bit h = mano del slot h, bit num_hands = cara);
+    - hands: (manos detectadas, 21, 3) solo de los slots presentes, en orden de frame y slot;
+    - face: (frames con cara, len(face_index), 3) con el subconjunto de landmarks faciales;
+    - *_range: origen y escala de la cuantización; header: versiones y dimensiones.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Precisión desconocida '{precision}', opciones: {PRECISIONS}")
+    frames = np.asarray(frames)
+    if frames.ndim != 2 or frames.shape[1] != layout.num_features:
+        raise ValueError(f"Se esperaba un clip (frames, {layout.num_features}) con el layout v{layout.version}, "
+                         f"no {frames.shape}")
+    hand_present = layout.hand_presence(frames)
+    face_present = layout.face_presence(frames)
+    bits = _presence_bits(layout.num_hands)
+    presence = (np.concatenate([hand_present, face_present[:, None]], axis=1) * bits).sum(axis=1, dtype=np.uint8)
+
+    hands, hand_range = _quantize(layout.hands(frames)[hand_present][..., :3], precision)
+    face = layout.face(frames)[face_present]
+    if face_index is not None:
+        face = face[:, face_index]
+    face, face_range = _quantize(face, precision)
+    arrays = {
+        'header': np.array([CODEC_VERSION, layout.version, layout.num_hands, layout.hand_landmarks,
+                            layout.face_landmarks, len(frames)], dtype=np.int64),
+        'presence': presence,
+        'hands': hands,
+        'hand_range': hand_range,
+        'face': face,
+        'face_range': face_range,
+    }
+    if face_index is not None:
+        arrays['face_index'] = np.asarray(face_index, dtype=np.int16)
+    return arrays
+
+def decode(arrays) -> np.ndarray:
+    """
+    Reconstruye el array denso float32 (frames, num_features) con el layout habitual.
+    Los slots ausentes y los landmarks faciales fuera del subconjunto quedan a cero.
+    """
+    version, layout_version, num_hands, hand_landmarks, face_landmarks, n = (int(v) for v in arrays['header'])
+    if version > CODEC_VERSION:
+        raise ValueError(f"Versión de codec {version} no soportada (máximo {CODEC_VERSION})")
+    layout = FeatureLayout(num_hands, hand_landmarks, face_landmarks, layout_version)
+    presence = arrays['presence']
+    bits = _presence_bits(num_hands)
+    mask = (presence[:, None] & bits) > 0
+
+    out = np.zeros((n, layout.num_features), dtype=np.float32)
+    hands = layout.hands(out)
+    hand_mask = mask[:, :num_hands]
+    hands[hand_mask, :, :3] = _dequantize(arrays['hands'], arrays['hand_range'])
+    hands[hand_mask, :, 3] = 1
+    face = _dequantize(arrays['face'], arrays['face_range'])
+    face_rows = np.flatnonzero(mask[:, num_hands])
+    if 'face_index' in arrays:
+        layout.face(out)[face_rows[:, None], arrays['face_index']] = face
+    else:
+        layout.face(out)[face_rows] = face
+    return out
+
+def save_compact(path: str, frames: np.ndarray, face_index=None, precision: str = 'u16', compress: bool = False) -> None:
+    """
+    Guarda un clip en formato compacto (.kpz, un .npz sin pickle).
+    `compress` añade deflate: algo menos de espacio a cambio de más CPU al leer.
+    """
+    arrays = encode(frames, face_index=face_index, precision=precision)
+    with open(path, 'wb') as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+
+def load_compact(path: str) -> np.ndarray:
+    with np.load(path) as arrays:
+        return decode(arrays)
+
+def load_features(path: str) -> np.ndarray:
+    """
+    Abre las features de un clip: los .npy en modo memmap y los .kpz decodificados
+    al layout denso. En ambos casos devuelve un array (frames, num_features).
+    """
+    if path.endswith(EXTENSION):
+        return load_compact(path)
+    return np.load(path, mmap_mode='r')
+
+def find_features(features_dir: str, stem: str) -> str:
+    """
+    Ruta de las features de `stem` en `features_dir` (.npy o .kpz) o None si no hay.
+    Si existen ambas se usa la más reciente.
+    """
+    paths = [os.path.join(features_dir, stem + ext) for ext in FEATURE_EXTENSIONS]
+    paths = [p for p in paths if os.path.isfile(p)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+def feature_stems(features_dir: str) -> list:
+    """
+    Stems de los clips con features en `features_dir`, en orden alfabético.
+    """
+    return sorted({os.path.splitext(f)[0] for f in os.listdir(features_dir)
+                   if f.endswith(FEATURE_EXTENSIONS)})
+
+def convert_dir(
+    features_dir: str,
+    face_index=None,
+    precision: str = 'u16',
+    compress: bool = False,
+    remove: bool = False
+) -> tuple:
+    """
+    Convierte los .npy de `features_dir` a .kpz (omite los que ya tienen un .kpz más
+    reciente). Devuelve (bytes antes, bytes después) de los clips convertidos.
+    """
+    before = after = 0
+    for stem in feature_stems(features_dir):
+        npy_path = os.path.join(features_dir, stem + '.npy')
+        kpz_path = os.path.join(features_dir, stem + EXTENSION)
+        if find_features(features_dir, stem) != npy_path:
+            continue
+        save_compact(kpz_path, np.load(npy_path, mmap_mode='r'), face_index, precision, compress)
+        before += os.path.getsize(npy_path)
+        after += os.path.getsize(kpz_path)
+        if remove:
+            os.remove(npy_path)
+    return before, after
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Convierte las features .npy al formato compacto .kpz.')
+    parser.add_argument('--features_dir', default='output', help='Directorio con los .npy por clip')
+    parser.add_argument('--precision', default='u16', choices=PRECISIONS,
+                        help='u16: punto fijo con el rango de cada clip; f16: media precisión')
+    parser.add_argument('--face_subset', default=None,
+                        help="Landmarks faciales a conservar: 'contorno' o índices separados por comas")
+    parser.add_argument('--compress', action='store_true', help='Comprimir además con deflate')
+    parser.add_argument('--remove_npy', action='store_true', help='Borrar los .npy convertidos')
+    args = parser.parse_args()
+    features_dir = args.features_dir if os.path.isabs(args.features_dir) else os.path.join(project_root, args.features_dir)
+    before, after = convert_dir(features_dir, face_subset(args.face_subset), args.precision,
+                                args.compress, args.remove_npy)
+    if not before:
+        print(f"No hay .npy pendientes de convertir en {features_dir}")
+    else:
+        print(f"Convertido: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({before / after:.1f}x)")
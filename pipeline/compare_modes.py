@@ -0,0 +1,157 @@
+import cv2
+import json
+import numpy as np
+import os
+import sys
+import time
+
+# Permitir ejecutar el script directamente (python pipeline/compare_modes.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.capture import KeypointExtractor, NUM_FEATURES, interpolate_face
+from pipeline.lector import LAYOUT
+
+# Configuraciones a comparar: nombre -> kwargs de KeypointExtractor.
+# 'stride' no es del extractor: procesa uno de cada N frames y repite el último
+# resultado en los intermedios para comparar con la referencia a frecuencia completa.
+# 'static' es la referencia (detección completa en cada frame).
+VARIANTS = {
+    'static': {},
+    'tracking': {'mode': False},
+    'tracking_redetect30': {'mode': False, 'redetectEvery': 30},
+    'tracking_redetect_con': {'mode': False, 'redetectCon': 0.8},
+    'max_size_480': {'maxInputSize': 480},
+    'max_size_320': {'maxInputSize': 320},
+    'stride2': {'stride': 2},
+    'stride3': {'stride': 3},
+    'tracking_stride2_320': {'mode': False, 'stride': 2, 'maxInputSize': 320},
+    'face_every3': {'faceEvery': 3},
+    'face_on_change': {'faceEvery': 10, 'faceChangeThreshold': 8.0},
+    'gate2': {'gateThreshold': 2.0},
+    'gate4': {'gateThreshold': 4.0},
+    'gate8_refresh10': {'gateThreshold': 8.0, 'gateRefresh': 10},
+    'hand_roi': {'handRoi': True},
+    'hand_roi_320': {'handRoi': True, 'maxInputSize': 320},
+}
+
+def load_frames(clip_path: str) -> list:
+    """
+    Decodifica un clip completo en memoria para no medir la decodificación.
+    """
+    cap = cv2.VideoCapture(clip_path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def run_variant(extractor: KeypointExtractor, frames: list, stride: int = 1) -> tuple:
+    """
+    Extrae las features de uno de cada `stride` frames y devuelve (features con una
+    fila por frame del clip, segundos de extracción). Los frames no procesados
+    repiten el último resultado, como vería el clasificador en vivo. Las caras no
+    inferidas (faceEvery/faceChangeThreshold) se interpolan como en process_clip.
+    """
+    extractor.reset()
+    sampled = frames[::stride]
+    features = np.empty((len(sampled), NUM_FEATURES), dtype=np.float32)
+    face_inferred = np.empty(len(sampled), dtype=bool)
+    start = time.perf_counter()
+    for i, frame in enumerate(sampled):
+        extractor.extract(frame, draw=False, out=features[i])
+        face_inferred[i] = extractor.face_inferred
+    seconds = time.perf_counter() - start
+    interpolate_face(features, ~face_inferred)
+    if stride > 1:
+        features = features[np.arange(len(frames)) // stride]
+    return features, seconds
+
+def landmark_drift(features: np.ndarray, baseline: np.ndarray) -> dict:
+    """
+    Compara dos arrays (frames, NUM_FEATURES) del mismo clip.
+    - *_drift: distancia media (x, y normalizados) entre landmarks cuando ambos detectan.
+    - *_agreement: fracción de frames en los que ambos coinciden en detectar o no.
+    """
+    hands, hands_ref = LAYOUT.hands(features), LAYOUT.hands(baseline)
+    face, face_ref = LAYOUT.face(features), LAYOUT.face(baseline)
+    hand_present, hand_present_ref = LAYOUT.hand_presence(features), LAYOUT.hand_presence(baseline)
+    face_present, face_present_ref = LAYOUT.face_presence(features), LAYOUT.face_presence(baseline)
+
+    both_hands = hand_present & hand_present_ref
+    both_face = face_present & face_present_ref
+    hand_dist = np.linalg.norm(hands[..., :2] - hands_ref[..., :2], axis=-1)
+    face_dist = np.linalg.norm(face[..., :2] - face_ref[..., :2], axis=-1)
+    return {
+        'hand_drift': float(hand_dist[both_hands].mean()) if both_hands.any() else None,
+        'face_drift': float(face_dist[both_face].mean()) if both_face.any() else None,
+        'hand_agreement': float((hand_present == hand_present_ref).mean()),
+        'face_agreement': float((face_present == face_present_ref).mean()),
+    }
+
+def compare_variants(clip_paths: list, variants: dict, baseline: str = 'static') -> dict:
+    """
+    Ejecuta cada variante sobre todos los clips y devuelve, por variante, los fps de
+    extracción y la deriva media de landmarks respecto a la variante `baseline`.
+    Los fps cuentan frames del clip por segundo, así las variantes con `stride` son
+    comparables con las que procesan todos los frames. `skip_rate` es la fracción de
+    frames que la compuerta (gateThreshold) resolvió sin inferencia.
+    """
+    strides = {name: kwargs.get('stride', 1) for name, kwargs in variants.items()}
+    extractors = {
+        name: KeypointExtractor(**{k: v for k, v in kwargs.items() if k != 'stride'})
+        for name, kwargs in variants.items()
+    }
+    totals = {name: {'frames': 0, 'seconds': 0.0, 'clips': []} for name in variants}
+    for clip_path in clip_paths:
+        frames = load_frames(clip_path)
+        if not frames:
+            continue
+        results = {name: run_variant(ext, frames, strides[name]) for name, ext in extractors.items()}
+        ref = results[baseline][0]
+        for name, (features, seconds) in results.items():
+            totals[name]['frames'] += len(frames)
+            totals[name]['seconds'] += seconds
+            totals[name]['clips'].append(landmark_drift(features, ref))
+
+    report = {}
+    for name, t in totals.items():
+        summary = {'fps': t['frames'] / t['seconds'] if t['seconds'] else None}
+        for key in ('hand_drift', 'face_drift', 'hand_agreement', 'face_agreement'):
+            values = [c[key] for c in t['clips'] if c[key] is not None]
+            summary[key] = float(np.mean(values)) if values else None
+        summary['skip_rate'] = extractors[name].skip_rate
+        summary['settings'] = variants[name]
+        report[name] = summary
+    return report
+
+def print_report(report: dict) -> None:
+    fmt = lambda v, spec: format(v, spec) if v is not None else '-'
+    print(f"{'variante':<24}{'fps':>8}{'saltados':>10}{'deriva manos':>14}{'deriva cara':>13}"
+          f"{'acuerdo manos':>15}{'acuerdo cara':>14}")
+    for name, r in report.items():
+        print(f"{name:<24}{fmt(r['fps'], '.1f'):>8}{fmt(r['skip_rate'], '.1%'):>10}"
+              f"{fmt(r['hand_drift'], '.4f'):>14}{fmt(r['face_drift'], '.4f'):>13}"
+              f"{fmt(r['hand_agreement'], '.1%'):>15}{fmt(r['face_agreement'], '.1%'):>14}")
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compara fps y deriva de landmarks entre modos del extractor.')
+    parser.add_argument('--clips_dir', default='data/clips', help='Directorio con clips brutos (.avi)')
+    parser.add_argument('--variants', nargs='*', default=list(VARIANTS), choices=list(VARIANTS),
+                        help='Variantes a comparar (la referencia es siempre static)')
+    parser.add_argument('--json', default=None, help='Ruta opcional para guardar el informe en JSON')
+    args = parser.parse_args()
+    clips_dir = args.clips_dir if os.path.isabs(args.clips_dir) else os.path.join(project_root, args.clips_dir)
+    clip_paths = [os.path.join(clips_dir, f) for f in sorted(os.listdir(clips_dir)) if f.lower().endswith('.avi')]
+    names = ['static'] + [v for v in args.variants if v != 'static']
+    report = compare_variants(clip_paths, {name: VARIANTS[name] for name in names})
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Informe guardado en {args.json}")
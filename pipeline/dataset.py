@@ -0,0 +1,48 @@
+import json
+import os
+
+from pipeline.codec import find_features, load_features
+
+def load_labels(labels_json: str) -> dict:
+    """
+    Carga data/labels.json y devuelve {stem: etiqueta}. Las claves del JSON pueden
+    ser el .avi o el .npy del clip; ambos se asocian al mismo stem.
+    """
+    with open(labels_json, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+    return {os.path.splitext(name)[0]: label for name, label in labels.items()}
+
+def labeled_clips(features_dir: str, labels_json: str):
+    """
+    Recorre los clips etiquetados que tienen features en `features_dir`.
+    Genera (stem, array (frames, num_features), etiqueta), abriendo cada .npy en
+    modo memmap para no cargar el corpus entero en RAM (los .kpz se decodifican clip a clip).
+    """
+    for stem, label in sorted(load_labels(labels_json).items()):
+        path = find_features(features_dir, stem)
+        if path is None:
+            print(f"⚠️  Sin features para '{stem}', se omite.")
+            continue
+        yield stem, load_features(path), label
+
+def dataset_fingerprint(features_dir: str, labels_json: str) -> list:
+    """
+    Huella de los clips etiquetados de `features_dir`: por clip, su etiqueta y la
+    entrada del manifest de extracción (hash del clip y ajustes del extractor) o,
+    si no la hay, el tamaño y la fecha del .npy/.kpz. Sirve como clave de caché.
+    """
+    manifest_path = os.path.join(features_dir, 'manifest.json')
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = {os.path.splitext(k)[0]: v for k, v in json.load(f).items()}
+    fingerprint = []
+    for stem, label in sorted(load_labels(labels_json).items()):
+        path = find_features(features_dir, stem)
+        if path is None:
+            continue
+        st = os.stat(path)
+        entry = manifest.get(stem)
+        source = [entry['hash'], entry['settings']] if entry else None
+        fingerprint.append([stem, label, source, st.st_size, st.st_mtime_ns])
+    return fingerprint
@@ -1,34 +1,105 @@
 import os
+import sys
 import numpy as np
 
+# Permitir ejecutar el script directamente (python pipeline/lector.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.layout import FEATURE_LAYOUT_VERSION, HAND_SIDES, HAND_LANDMARKS, FACE_LANDMARKS
+
+class FeatureLayout:
+    """
+    Describe el layout del vector de features por frame: `num_hands` slots de mano
+    ([Right, Left]) con 21 landmarks de (x, y, z, presencia) seguidos de la cara con
+    468 landmarks de (x, y, z). Los valores por defecto son los de src/layout.py, los
+    mismos con los que extrae src/capture.py.
+    Los métodos aceptan un frame (num_features,) o un clip entero (frames, num_features)
+    y devuelven vistas sobre el mismo buffer (sin copias) cuando las filas son contiguas,
+    como en los .npy, los memmap y el FeatureStore.
+    """
+    def __init__(self, num_hands: int = len(HAND_SIDES), hand_landmarks: int = HAND_LANDMARKS,
+                 face_landmarks: int = FACE_LANDMARKS, version: int = FEATURE_LAYOUT_VERSION):
+        self.num_hands = num_hands
+        self.hand_landmarks = hand_landmarks
+        self.face_landmarks = face_landmarks
+        self.version = version
+        self.hand_size = hand_landmarks * 4
+        self.face_offset = num_hands * self.hand_size
+        self.num_features = self.face_offset + face_landmarks * 3
+
+    def hands(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Vista (..., num_hands, 21, 4) con x, y, z, presencia de cada mano.
+        """
+        lead = frames.shape[:-1]
+        return frames[..., :self.face_offset].reshape(lead + (self.num_hands, self.hand_landmarks, 4))
+
+    def face(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Vista (..., 468, 3) con x, y, z de cada landmark facial.
+        """
+        lead = frames.shape[:-1]
+        return frames[..., self.face_offset:self.num_features].reshape(lead + (self.face_landmarks, 3))
+
+    def hand_presence(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Máscara booleana (..., num_hands): True si la mano de ese slot fue detectada.
+        """
+        return self.hands(frames)[..., 0, 3] > 0
+
+    def face_presence(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Máscara booleana (...,): True si se detectó la cara (la cara ausente se rellena con ceros).
+        """
+        return np.any(self.face(frames) != 0, axis=(-2, -1))
+
+# Layout por defecto (2 manos + cara)
+LAYOUT = FeatureLayout()
+
+def _load(ruta: str) -> np.ndarray:
+    """
+    Abre un .npy (memmap) o un .kpz (formato compacto, decodificado al layout denso).
+    """
+    # Import diferido: pipeline.codec depende de FeatureLayout, definido en este módulo
+    from pipeline.codec import load_features
+    return load_features(ruta)
+
 def _analyze_vector(vector: np.ndarray, maxHands: int = 2):
     """
     Interpreta un vector plano de features en coordenadas de manos y cara.
     """
-    per_hand = 21 * 4  # 4 valores por landmark: x,y,z,presencia
+    layout = FeatureLayout(num_hands=maxHands)
     print("\n-- Análisis del primer frame --")
-    for h in range(maxHands):
-        start = h * per_hand
-        hand = vector[start:start+per_hand].reshape(21, 4)
+    for h, hand in enumerate(layout.hands(vector)):
         print(f"Mano {h+1}, Landmark[0]: x={hand[0,0]:.3f}, y={hand[0,1]:.3f}, z={hand[0,2]:.3f}, p={hand[0,3]:.0f}")
-    face = vector[maxHands*per_hand:].reshape(468, 3)
+    face = layout.face(vector)
     print(f"Cara, Landmark[0]: x={face[0,0]:.3f}, y={face[0,1]:.3f}, z={face[0,2]:.3f}")
 
+def _print_detection_rates(datos: np.ndarray):
+    """
+    Porcentaje de frames del clip con cada mano y con cara detectadas.
+    """
+    hands = LAYOUT.hand_presence(datos).mean(axis=0)
+    face = LAYOUT.face_presence(datos).mean()
+    print(f"   Detección: mano derecha {hands[0]*100:.1f}%, mano izquierda {hands[1]*100:.1f}%, cara {face*100:.1f}%")
+
 def leer_todos_los_npy():
     # Obtener la ruta absoluta a la carpeta 'output' (una carpeta arriba de 'pipeline')
     carpeta_output = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output'))
 
-    # Listar solo los archivos que terminan en .npy
-    archivos = [f for f in os.listdir(carpeta_output) if f.endswith('.npy')]
+    # Listar solo los archivos de features (.npy o .kpz compacto)
+    archivos = [f for f in os.listdir(carpeta_output) if f.endswith(('.npy', '.kpz'))]
 
     if not archivos:
-        print("No se encontraron archivos .npy en la carpeta 'output'.")
+        print("No se encontraron archivos .npy ni .kpz en la carpeta 'output'.")
         return
 
     for archivo in archivos:
         ruta_completa = os.path.join(carpeta_output, archivo)
         try:
-            datos = np.load(ruta_completa, allow_pickle=True)
+            datos = _load(ruta_completa)
             print(f"\n📄 Archivo: {archivo}")
             print(f"   Forma (shape): {datos.shape if hasattr(datos, 'shape') else 'No aplica'}")
             print("   Contenido:")
@@ -46,6 +117,7 @@ def leer_todos_los_npy():
                     total_feats = datos.shape[1]
                     ratios = nz_frames / total_feats
                     print(f"   Ratio non-cero por frame: min {ratios.min():.2f}, max {ratios.max():.2f}, avg {ratios.mean():.2f}")
+                    _print_detection_rates(datos)
                 else:
                     print(datos)
         except Exception as e:
@@ -60,7 +132,7 @@ def leer_npy_especifico(nombre_archivo):
         return
 
     try:
-        datos = np.load(ruta, allow_pickle=True)
+        datos = _load(ruta)
         print(f"\n📄 Archivo: {nombre_archivo}")
         print(f"   Forma (shape): {datos.shape if hasattr(datos, 'shape') else 'No aplica'}")
         print("   Contenido:")
@@ -76,6 +148,7 @@ def leer_npy_especifico(nombre_archivo):
             total_feats = datos.shape[1]
             ratios = nz_frames / total_feats
             print(f"   Ratio non-cero por frame: min {ratios.min():.2f}, max {ratios.max():.2f}, avg {ratios.mean():.2f}")
+            _print_detection_rates(datos)
         else:
             print(datos)
     except Exception as e:
@@ -83,39 +156,33 @@ def leer_npy_especifico(nombre_archivo):
 
 def get_hand_landmarks(vector: np.ndarray, maxHands: int = 2) -> np.ndarray:
     """
-    Dado un vector plano de (3*21*maxHands + 3*468), devuelve un array de forma
-    (maxHands, 21, 3) con las coordenadas (x,y,z) de cada landmark de las manos.
+    Dado un vector plano de (4*21*maxHands + 3*468), devuelve un array de forma
+    (maxHands, 21, 4) con las coordenadas (x,y,z) y la presencia de cada landmark de las manos.
+    Para un clip entero (frames, num_features) usar FeatureLayout.hands.
     """
-    # Si se pasa un string, interpretarlo como nombre de .npy en carpeta 'output'
+    # Si se pasa un string, interpretarlo como nombre de .npy o .kpz en carpeta 'output'
     if isinstance(vector, str):
         archivo = vector
         carpeta_output = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output'))
         ruta = os.path.join(carpeta_output, archivo)
-        arr = np.load(ruta)
+        arr = _load(ruta)  # con .npy solo se lee del disco el frame usado
         vector = arr[0]  # primer frame por defecto
-    per_hand = 21 * 4  # x,y,z,p per landmark
-    hands = []
-    for i in range(maxHands):
-        start = i * per_hand
-        hand_vec = vector[start:start + per_hand]
-        hands.append(hand_vec.reshape(21, 4))
-    return np.stack(hands, axis=0)
+    return FeatureLayout(num_hands=maxHands).hands(vector)
 
 def get_face_landmarks(vector: np.ndarray, maxHands: int = 2) -> np.ndarray:
     """
-    Dado un vector plano de (3*21*maxHands + 3*468), devuelve un array de forma
+    Dado un vector plano de (4*21*maxHands + 3*468), devuelve un array de forma
     (468, 3) con las coordenadas (x,y,z) de cada landmark facial.
+    Para un clip entero (frames, num_features) usar FeatureLayout.face.
     """
     # Permitir filename como input
     if isinstance(vector, str):
         archivo = vector
         carpeta_output = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output'))
         ruta = os.path.join(carpeta_output, archivo)
-        arr = np.load(ruta)
+        arr = _load(ruta)  # con .npy solo se lee del disco el frame usado
         vector = arr[0]
-    per_hand = 21 * 4
-    face_vec = vector[maxHands * per_hand:]
-    return face_vec.reshape(468, 3)
+    return FeatureLayout(num_hands=maxHands).face(vector)
 
 
 
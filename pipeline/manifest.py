@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = 'manifest.json'
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Devuelve el SHA-256 del contenido de `path`, leído por bloques.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class Manifest:
+    """
+    Registro de las features ya extraídas en `out_dir`.
+    Cada entrada (por nombre de clip) guarda el hash del contenido del clip, los
+    ajustes del extractor (que incluyen la versión del layout) y las salidas generadas.
+    Una salida se considera al día si las tres cosas coinciden y los ficheros existen.
+    """
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def clip_hash(self, clip_path: str) -> str:
+        """
+        Hash del clip. Si el tamaño y la fecha de modificación no cambiaron desde la
+        última vez se reutiliza el hash guardado, así un rerun no vuelve a leer cada vídeo.
+        """
+        st = os.stat(clip_path)
+        entry = self.entries.get(os.path.basename(clip_path))
+        if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+            return entry['hash']
+        return file_hash(clip_path)
+
+    def is_fresh(self, clip_path: str, settings: dict, outputs: list) -> bool:
+        entry = self.entries.get(os.path.basename(clip_path))
+        if entry is None:
+            return False
+        if entry['settings'] != settings:
+            return False
+        if not {self._rel(p) for p in outputs} <= set(entry['outputs']):
+            return False
+        if not all(os.path.isfile(p) for p in outputs):
+            return False
+        if entry['hash'] != self.clip_hash(clip_path):
+            return False
+        # Mismo contenido con otra fecha (copia, touch): refrescar para no volver a hashear
+        st = os.stat(clip_path)
+        entry['size'] = st.st_size
+        entry['mtime_ns'] = st.st_mtime_ns
+        return True
+
+    def update(self, clip_path: str, settings: dict, outputs: list) -> None:
+        st = os.stat(clip_path)
+        self.entries[os.path.basename(clip_path)] = {
+            'hash': self.clip_hash(clip_path),
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'settings': settings,
+            'outputs': [self._rel(p) for p in outputs],
+        }
+
+    def _rel(self, path: str) -> str:
+        # Rutas relativas a out_dir para que el manifest siga valiendo si se mueve la carpeta
+        return os.path.relpath(path, self.out_dir).replace(os.sep, '/')
+
+    def save(self) -> None:
+        # Escritura atómica para no dejar un manifest a medias si se interrumpe el lote
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
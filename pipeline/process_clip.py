@@ -1,64 +1,499 @@
 import cv2
+import json
 import numpy as np
 import os
-from src.capture import KeypointExtractor
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util
+
+# Permitir ejecutar el script directamente (python pipeline/process_clip.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.capture import (KeypointExtractor, NUM_FEATURES, FEATURE_LAYOUT_VERSION, extractor_settings,
+                         interpolate_face)
+from src.metrics import create_metrics
+from pipeline.codec import EXTENSION, save_compact
+from pipeline.manifest import Manifest
+from pipeline.render import render_clip
+
+_END = object()  # marca de fin de cola
+
+def _read_frames(cap, stride: int = 1):
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield frame
+        # Los frames descartados se saltan con grab(), sin decodificarlos
+        for _ in range(stride - 1):
+            if not cap.grab():
+                return
+
+def _threaded_read_frames(cap, queue_size: int, stride: int = 1):
+    """
+    Igual que _read_frames, pero la decodificación corre en un hilo aparte que va
+    llenando una cola acotada, así no bloquea la inferencia.
+    """
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def decode():
+        try:
+            for frame in _read_frames(cap, stride):
+                while not stop.is_set():
+                    try:
+                        frames.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            frames.put(_END)
+
+    thread = threading.Thread(target=decode, name='decoder', daemon=True)
+    thread.start()
+    try:
+        while True:
+            frame = frames.get()
+            if frame is _END:
+                break
+            yield frame
+    finally:
+        # Si el consumidor termina antes (p.ej. por un error) liberar al decodificador
+        stop.set()
+        while thread.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+    if errors:
+        raise errors[0]
+
+class _ThreadedWriter:
+    """
+    Envuelve un cv2.VideoWriter: write() encola el frame y un hilo aparte lo codifica.
+    release() espera a que se vacíe la cola y propaga cualquier error del hilo.
+    """
+    def __init__(self, writer, queue_size: int):
+        self.writer = writer
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._encode, name='encoder', daemon=True)
+        self.thread.start()
+
+    def _encode(self):
+        while True:
+            frame = self.frames.get()
+            if frame is _END:
+                return
+            if self.error is None:
+                try:
+                    self.writer.write(frame)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.frames.put(frame)
+
+    def release(self):
+        self.frames.put(_END)
+        self.thread.join()
+        self.writer.release()
+        if self.error is not None:
+            raise self.error
 
 def process_clip(
     clip_path: str,
     output_features_path: str,
-    annotated_video_path: str = None
-) -> None:
+    annotated_video_path: str = None,
+    extractor: KeypointExtractor = None,
+    verbose: bool = True,
+    pipelined: bool = False,
+    queue_size: int = 16,
+    stride: int = 1,
+    target_fps: float = None,
+    metrics=None
+) -> int:
     """
-    Procesa un clip AVI para extraer keypoints de manos y cara.
-    - Guarda un array NumPy de forma (num_frames, num_features) en output_features_path.
-    - Opcionalmente guarda un vídeo anotado con landmarks en annotated_video_path.
+    Extrae los keypoints de un clip AVI a output_features_path (.npy, o .kpz compacto)
+    con un .json de metadatos y, si se indica, un vídeo anotado. Procesa uno de cada
+    `stride` frames (o el paso que da `target_fps`) y reutiliza `extractor` si se pasa.
+    Devuelve el número de frames procesados.
     """
-    extractor = KeypointExtractor()
+    if stride < 1 or (target_fps is not None and target_fps <= 0):
+        raise ValueError(f"stride debe ser >= 1 y target_fps > 0 (stride={stride}, target_fps={target_fps})")
+    if extractor is None:
+        extractor = KeypointExtractor()
+    else:
+        # En modo vídeo el estado de seguimiento del clip anterior no vale para este
+        extractor.reset()
     cap = cv2.VideoCapture(clip_path)
-    features = []
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if target_fps:
+        stride = max(1, round(source_fps / target_fps))
+    # Buffer float32 del tamaño del clip; cada frame se escribe directamente en su fila
+    capacity = max(-(-int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) // stride), 1)
+    features = np.empty((capacity, NUM_FEATURES), dtype=np.float32)
+    face_inferred = np.empty(capacity, dtype=bool)
+    inferred = np.empty(capacity, dtype=bool)
+    n_frames = 0
     writer = None
 
     if annotated_video_path:
-        fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = source_fps / stride
         fourcc = cv2.VideoWriter_fourcc(*'XVID')
         writer = cv2.VideoWriter(annotated_video_path, fourcc, fps, (width, height))
+        if pipelined:
+            writer = _ThreadedWriter(writer, queue_size)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        # Extrae y dibuja landmarks en frame interno
-        kp = extractor.extract(frame)
-        features.append(kp)
+    # pipelined: decodificación y codificación en hilos propios unidos a la inferencia por
+    # colas de `queue_size` frames; el orden y el .npy resultante son idénticos
+    if pipelined:
+        frames = _threaded_read_frames(cap, queue_size, stride)
+    else:
+        frames = _read_frames(cap, stride)
+    # Con metrics: spans clip.read, clip.write, clip.save y clip.total, contadores clips y clip.frames
+    clip_start = last = time.perf_counter() if metrics is not None else None
+    try:
+        for frame in frames:
+            if metrics is not None:
+                now = time.perf_counter()
+                metrics.observe('clip.read', now - last)
+            if n_frames == len(features):
+                # CAP_PROP_FRAME_COUNT es solo una estimación en algunos AVI
+                features = np.concatenate([features, np.empty_like(features)])
+                face_inferred = np.concatenate([face_inferred, np.empty_like(face_inferred)])
+                inferred = np.concatenate([inferred, np.empty_like(inferred)])
+            # Extrae landmarks; solo se dibujan si hay vídeo anotado que escribir
+            extractor.extract(frame, draw=writer is not None, out=features[n_frames])
+            face_inferred[n_frames] = extractor.face_inferred
+            inferred[n_frames] = extractor.inferred
+            n_frames += 1
+            if writer:
+                if metrics is None:
+                    writer.write(frame)
+                else:
+                    with metrics.span('clip.write'):
+                        writer.write(frame)
+            if metrics is not None:
+                last = time.perf_counter()
+    finally:
+        frames.close()
+        cap.release()
         if writer:
-            writer.write(frame)
+            writer.release()
 
-    cap.release()
-    if writer:
-        writer.release()
+    if n_frames == 0:
+        raise ValueError(f"No se pudo leer ningún frame de {clip_path}")
+    # Con faceEvery/faceChangeThreshold las caras repetidas se sustituyen por interpolación;
+    # sus índices quedan en el .json (`face_filled`), igual que los de la compuerta (`reused`)
+    face_filled = np.flatnonzero(~face_inferred[:n_frames])
+    interpolate_face(features[:n_frames], face_filled)
+    save_start = time.perf_counter() if metrics is not None else None
+    if output_features_path.endswith(EXTENSION):
+        save_compact(output_features_path, features[:n_frames])
+    else:
+        np.save(output_features_path, features[:n_frames])
+    write_metadata(output_features_path, {
+        'frames': n_frames,
+        'source_fps': source_fps,
+        'stride': stride,
+        'target_fps': target_fps,
+        'fps': source_fps / stride,
+        'width': width,
+        'height': height,
+        'face_filled': face_filled.tolist(),
+        'reused': np.flatnonzero(~inferred[:n_frames]).tolist(),
+        'settings': extractor.settings,
+    })
+    if metrics is not None:
+        now = time.perf_counter()
+        metrics.observe('clip.save', now - save_start)
+        metrics.observe('clip.total', now - clip_start)
+        metrics.count('clips')
+        metrics.count('clip.frames', n_frames)
+    if verbose:
+        print(f"Features guardadas en: {output_features_path}")
+        if annotated_video_path:
+            print(f"Vídeo anotado guardado en: {annotated_video_path}")
+    return n_frames
 
-    arr = np.stack(features, axis=0)
-    np.save(output_features_path, arr)
-    print(f"Features guardadas en: {output_features_path}")
-    if annotated_video_path:
-        print(f"Vídeo anotado guardado en: {annotated_video_path}")
+def write_metadata(features_path: str, meta: dict) -> None:
+    """
+    Guarda los metadatos de unas features en un .json junto al .npy.
+    """
+    with open(os.path.splitext(features_path)[0] + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
 
-if __name__ == '__main__':
-    # Carpeta de clips por defecto y salida en 'output' al nivel del proyecto
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    clips_dir = os.path.join(project_root, 'data', 'clips')
-    out_dir = os.path.join(project_root, 'output')
-    annotated_dir = os.path.join(out_dir, 'annotated')
+def recorded_keypoints(clips_dir: str, stem: str, settings: dict = None):
+    """
+    Keypoints guardados por ClipRecorder al grabar el clip (data/clips/keypoints/).
+    Devuelve (ruta del .npy, metadatos de la grabación) o None si no existen, tienen
+    un layout distinto del actual o, si se pasan `settings` (ajustes del extractor
+    pedidos), se extrajeron con otros ajustes.
+    """
+    base = os.path.join(clips_dir, 'keypoints', stem)
+    if not (os.path.isfile(base + '.npy') and os.path.isfile(base + '.json')):
+        return None
+    with open(base + '.json', 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    recorded = meta.get('settings') or {}
+    if recorded.get('layout_version') != FEATURE_LAYOUT_VERSION:
+        return None
+    if settings is not None and recorded != settings:
+        return None
+    return base + '.npy', meta
+
+# Extractor propio de cada proceso del pool (se construye una sola vez por worker)
+_worker_extractor = None
+_worker_clip_kwargs = {}
+
+_worker_metrics = None
+
+def _init_worker(extractor_kwargs=None, clip_kwargs=None, metrics_log=None):
+    global _worker_extractor, _worker_clip_kwargs, _worker_metrics
+    # Cada worker exporta sus propias líneas (con su pid) al mismo log JSON
+    _worker_metrics = create_metrics(json_log=metrics_log)
+    if _worker_metrics is not None:
+        util.Finalize(_worker_metrics, _worker_metrics.close, exitpriority=10)
+    _worker_extractor = KeypointExtractor(**(extractor_kwargs or {}), metrics=_worker_metrics)
+    _worker_clip_kwargs = dict(clip_kwargs or {}, metrics=_worker_metrics)
+
+def _process_job(job):
+    """
+    Procesa un clip dentro de un worker. Nunca lanza excepciones: los fallos se
+    devuelven como texto para que un clip defectuoso no detenga el lote.
+    """
+    clip_path, feat_path, annot_path = job
+    start = time.perf_counter()
+    try:
+        n_frames = process_clip(clip_path, feat_path, annot_path,
+                                extractor=_worker_extractor, verbose=False, **_worker_clip_kwargs)
+        error = None
+    except Exception as e:
+        n_frames = 0
+        error = f"{type(e).__name__}: {e}"
+    return clip_path, n_frames, time.perf_counter() - start, error
+
+def process_batch(
+    clips_dir: str,
+    out_dir: str,
+    annotated_dir: str = None,
+    workers: int = None,
+    extractor_kwargs: dict = None,
+    force: bool = False,
+    pipelined: bool = False,
+    use_recorded=False,
+    stride: int = 1,
+    target_fps: float = None,
+    compact: bool = False,
+    metrics_log: str = None
+) -> list:
+    """
+    Procesa con process_clip todos los .avi de `clips_dir` en un pool de procesos,
+    saltando los que el manifest de `out_dir` da por al día (salvo con `force`).
+    Devuelve la lista de (clip, error) de los clips que fallaron.
+    """
+    workers = workers or os.cpu_count() or 1
     os.makedirs(out_dir, exist_ok=True)
-    os.makedirs(annotated_dir, exist_ok=True)
-    # Procesar todos los clips .avi
+    if annotated_dir:
+        os.makedirs(annotated_dir, exist_ok=True)
+    # El submuestreo también cambia las features: forma parte de la clave del manifest
+    settings = dict(extractor_settings(**(extractor_kwargs or {})), stride=stride, target_fps=target_fps)
+    manifest = Manifest(out_dir)
+
+    jobs = []
+    skipped = 0
+    imported = 0
     for fname in sorted(os.listdir(clips_dir)):
         if not fname.lower().endswith('.avi'):
             continue
-        clip_path = os.path.join(clips_dir, fname)
         stem = os.path.splitext(fname)[0]
-        feat_path = os.path.join(out_dir, f"{stem}.npy")
-        annot_path = os.path.join(annotated_dir, f"{stem}_annot.avi")
-        process_clip(clip_path, feat_path, annot_path)
+        clip_path = os.path.join(clips_dir, fname)
+        feat_path = os.path.join(out_dir, stem + (EXTENSION if compact else '.npy'))
+        annot_path = os.path.join(annotated_dir, f"{stem}_annot.avi") if annotated_dir else None
+        outputs = [p for p in (feat_path, annot_path) if p]
+        # use_recorded: copiar los keypoints guardados al grabar en vez de reextraer, si se
+        # grabaron con los ajustes pedidos ('any': con los de la grabación, sean cuales sean).
+        # Tienen todos los frames: solo sirven sin submuestreo
+        recorded = None
+        if use_recorded and stride == 1 and not target_fps:
+            wanted = None if use_recorded == 'any' else extractor_settings(**(extractor_kwargs or {}))
+            recorded = recorded_keypoints(clips_dir, stem, wanted)
+        # Una salida importada de la grabación queda obsoleta si deja de usarse la grabación
+        # o cambian los ajustes con los que se grabó
+        clip_settings = dict(settings, source='recorded', recorded=recorded[1]['settings']) if recorded else settings
+        if not force and manifest.is_fresh(clip_path, clip_settings, outputs):
+            skipped += 1
+            continue
+        if recorded:
+            # Keypoints ya extraídos al grabar: solo guardar (y anotar sin inferencia si se pide)
+            frames = np.load(recorded[0])
+            # En vivo la cara de los frames sin FaceMesh se repite; aquí se puede interpolar
+            interpolate_face(frames, recorded[1].get('face_filled', []))
+            if compact:
+                save_compact(feat_path, frames)
+            else:
+                np.save(feat_path, frames)
+            write_metadata(feat_path, dict(recorded[1], source='recorded'))
+            if annot_path:
+                render_clip(clip_path, feat_path, annot_path)
+            manifest.update(clip_path, clip_settings, outputs)
+            imported += 1
+            continue
+        jobs.append((clip_path, feat_path, annot_path))
+    if skipped:
+        print(f"{skipped} clips al día según {manifest.path}, se omiten.")
+    if imported:
+        print(f"{imported} clips con keypoints de la grabación copiados sin reextraer.")
+    if not jobs:
+        manifest.save()
+        print(f"No hay clips .avi pendientes en {clips_dir}")
+        return []
+
+    workers = min(workers, len(jobs))
+    print(f"Procesando {len(jobs)} clips con {workers} worker(s)...")
+    failures = []
+    total_frames = 0
+    start = time.perf_counter()
+
+    def report(done, result):
+        nonlocal total_frames
+        clip_path, n_frames, elapsed, error = result
+        total_frames += n_frames
+        wall = time.perf_counter() - start
+        name = os.path.basename(clip_path)
+        if error:
+            failures.append((clip_path, error))
+            status = f"ERROR ({error})"
+        else:
+            status = f"{n_frames} frames en {elapsed:.1f}s"
+            job = jobs_by_clip[clip_path]
+            manifest.update(clip_path, settings, [p for p in job[1:] if p])
+            if done % 25 == 0:
+                manifest.save()
+        print(f"[{done}/{len(jobs)}] {name}: {status} | "
+              f"{done / wall:.2f} clips/s, {total_frames / wall:.1f} frames/s")
+
+    jobs_by_clip = {job[0]: job for job in jobs}
+    # Cada worker construye su extractor una vez y, con `metrics_log`, añade sus métricas a ese log
+    clip_kwargs = {'pipelined': pipelined, 'stride': stride, 'target_fps': target_fps}
+    try:
+        if workers == 1:
+            _init_worker(extractor_kwargs, clip_kwargs, metrics_log)
+            try:
+                for done, job in enumerate(jobs, 1):
+                    report(done, _process_job(job))
+            finally:
+                if _worker_metrics is not None:
+                    _worker_metrics.close()
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(extractor_kwargs, clip_kwargs, metrics_log))
+            try:
+                futures = {pool.submit(_process_job, job): job for job in jobs}
+                for done, future in enumerate(as_completed(futures), 1):
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        # Un worker murió (sin memoria, fallo nativo...): el pool ya no sirve y
+                        # sus clips pendientes fallan aquí en vez de dejar el lote colgado.
+                        # Los terminados quedan en el manifest; relanzar reintenta el resto
+                        result = (futures[future][0], 0, 0.0, f"{type(e).__name__}: {e}")
+                    report(done, result)
+            finally:
+                # Cierre ordenado: los workers exportan sus últimas métricas al salir
+                pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        # Guardar lo ya procesado aunque el lote se interrumpa
+        manifest.save()
+
+    wall = time.perf_counter() - start
+    print(f"Terminado: {len(jobs) - len(failures)}/{len(jobs)} clips, {total_frames} frames "
+          f"en {wall:.1f}s ({total_frames / wall:.1f} frames/s)")
+    for clip_path, error in failures:
+        print(f"⚠️  Falló '{os.path.basename(clip_path)}': {error}")
+    return failures
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Procesa en lote los clips .avi para extraer keypoints.')
+    parser.add_argument('--clips_dir', default='data/clips', help='Directorio con clips brutos (.avi)')
+    parser.add_argument('--out_dir', default='output', help='Directorio de salida para los .npy')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Número de procesos en paralelo')
+    parser.add_argument('--annotated', action='store_true',
+                        help='Generar también vídeos anotados (también se pueden crear luego con pipeline/render.py)')
+    parser.add_argument('--force', action='store_true', help='Reprocesar aunque el manifest indique que está al día')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Decodificar y codificar en hilos aparte de la inferencia')
+    parser.add_argument('--stride', type=int, default=1, help='Procesar uno de cada N frames')
+    parser.add_argument('--target_fps', type=float, default=None,
+                        help='Submuestrear cada clip a estos fps (prevalece sobre --stride)')
+    parser.add_argument('--max_input_size', type=int, default=None,
+                        help='Reducir la imagen para que su lado mayor no supere estos píxeles')
+    parser.add_argument('--face_every', type=int, default=1,
+                        help='Ejecutar FaceMesh solo cada N frames (la cara intermedia se interpola)')
+    parser.add_argument('--face_change', type=float, default=0.0,
+                        help='Con --face_every, ejecutar antes FaceMesh si la región de la cara cambia más que este umbral (0-255)')
+    parser.add_argument('--gate_threshold', type=float, default=0.0,
+                        help='Reutilizar los keypoints anteriores si el frame difiere menos que este umbral (0-255)')
+    parser.add_argument('--gate_refresh', type=int, default=30,
+                        help='Con --gate_threshold, inferir siempre al menos cada N frames')
+    parser.add_argument('--hand_roi', action='store_true',
+                        help='Detectar las manos en un recorte alrededor de las del frame anterior (no con --tracking)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Guardar las features en formato compacto .kpz (ver pipeline/codec.py)')
+    parser.add_argument('--metrics_log', default=None,
+                        help="Fichero donde añadir métricas por etapa en líneas JSON ('-' = stderr)")
+    parser.add_argument('--use_recorded', nargs='?', const='match', default=False, choices=['match', 'any'],
+                        help="Copiar los keypoints de la grabación en vez de reextraer si sus ajustes coinciden "
+                             "('any': con los ajustes de cada grabación, sean cuales sean)")
+    parser.add_argument('--tracking', action='store_true',
+                        help='Modo vídeo: seguir landmarks entre frames en vez de detectar en cada uno')
+    parser.add_argument('--redetect_every', type=int, default=0,
+                        help='En modo vídeo, forzar re-detección cada N frames (0 = nunca)')
+    parser.add_argument('--redetect_con', type=float, default=0.0,
+                        help='En modo vídeo, volver a detectar en cuanto la presencia de una mano seguida baje de este valor')
+    args = parser.parse_args()
+    if args.stride < 1:
+        parser.error('--stride debe ser >= 1')
+    if args.target_fps is not None and args.target_fps <= 0:
+        parser.error('--target_fps debe ser > 0')
+    # Carpeta de clips por defecto y salida en 'output' al nivel del proyecto
+    clips_dir = args.clips_dir if os.path.isabs(args.clips_dir) else os.path.join(project_root, args.clips_dir)
+    out_dir = args.out_dir if os.path.isabs(args.out_dir) else os.path.join(project_root, args.out_dir)
+    annotated_dir = os.path.join(out_dir, 'annotated') if args.annotated else None
+    extractor_kwargs = {}
+    if args.tracking:
+        extractor_kwargs = {'mode': False, 'redetectEvery': args.redetect_every, 'redetectCon': args.redetect_con}
+    if args.max_input_size:
+        extractor_kwargs['maxInputSize'] = args.max_input_size
+    if args.face_every > 1 or args.face_change:
+        extractor_kwargs.update(faceEvery=args.face_every, faceChangeThreshold=args.face_change)
+    if args.hand_roi:
+        if args.tracking:
+            parser.error('--hand_roi no es compatible con --tracking')
+        extractor_kwargs['handRoi'] = True
+    if args.gate_threshold:
+        extractor_kwargs.update(gateThreshold=args.gate_threshold, gateRefresh=args.gate_refresh)
+    failures = process_batch(clips_dir, out_dir, annotated_dir, workers=args.workers,
+                             extractor_kwargs=extractor_kwargs, force=args.force,
+                             pipelined=args.pipelined, use_recorded=args.use_recorded,
+                             stride=args.stride, target_fps=args.target_fps, compact=args.compact,
+                             metrics_log=args.metrics_log)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,105 @@
+import cv2
+import json
+import os
+import sys
+
+# Permitir ejecutar el script directamente (python pipeline/render.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.capture import draw_keypoints
+from pipeline.codec import feature_stems, find_features, load_features
+
+def read_metadata(features_path: str) -> dict:
+    """
+    Metadatos (.json) que process_clip guarda junto a unas features; {} si no existen.
+    """
+    meta_path = os.path.splitext(features_path)[0] + '.json'
+    if not os.path.isfile(meta_path):
+        return {}
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def render_clip(
+    clip_path: str,
+    features_path: str,
+    annotated_video_path: str
+) -> int:
+    """
+    Genera un vídeo anotado a partir del clip original y de sus features ya extraídas,
+    sin volver a ejecutar MediaPipe. Devuelve el número de frames escritos.
+    Si las features se extrajeron con submuestreo (`stride` en su .json), la fila k
+    se dibuja sobre el frame k*stride del clip, los intermedios se saltan y el vídeo
+    se escribe a source_fps/stride, igual que el vídeo anotado de process_clip.
+    Lanza ValueError si los metadatos no corresponden al clip.
+    """
+    features = load_features(features_path)
+    meta = read_metadata(features_path)
+    stride = int(meta.get('stride', 1))
+    cap = cv2.VideoCapture(clip_path)
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    name = os.path.basename(clip_path)
+    if stride < 1:
+        cap.release()
+        raise ValueError(f"{name}: stride inválido en los metadatos ({stride})")
+    if meta.get('source_fps') and abs(meta['source_fps'] - source_fps) > 0.01:
+        cap.release()
+        raise ValueError(f"{name}: las features son de un vídeo a {meta['source_fps']} fps y el clip va a {source_fps}")
+    if meta.get('target_fps') and max(1, round(source_fps / meta['target_fps'])) != stride:
+        cap.release()
+        raise ValueError(f"{name}: stride {stride} no corresponde a target_fps {meta['target_fps']}")
+    if frame_count and -(-frame_count // stride) < len(features):
+        cap.release()
+        raise ValueError(f"{name}: {len(features)} filas de features con stride {stride} "
+                         f"no caben en un clip de {frame_count} frames")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fourcc = cv2.VideoWriter_fourcc(*'XVID')
+    writer = cv2.VideoWriter(annotated_video_path, fourcc, source_fps / stride, (width, height))
+
+    n = 0
+    while n < len(features):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        draw_keypoints(frame, features[n])
+        writer.write(frame)
+        n += 1
+        # Frames que el submuestreo no pasó por el extractor: se saltan sin decodificar
+        for _ in range(stride - 1):
+            if not cap.grab():
+                break
+
+    cap.release()
+    writer.release()
+    if n != len(features):
+        print(f"⚠️  {name}: el clip tiene {n} frames con stride {stride} y las features {len(features)}")
+    print(f"Vídeo anotado guardado en: {annotated_video_path}")
+    return n
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Genera vídeos anotados a partir de clips y sus .npy.')
+    parser.add_argument('stems', nargs='*', help='Clips a renderizar (p.ej. clip_20250618_000839); por defecto todos')
+    parser.add_argument('--clips_dir', default='data/clips', help='Directorio con clips brutos (.avi)')
+    parser.add_argument('--out_dir', default='output', help='Directorio con los .npy o .kpz')
+    args = parser.parse_args()
+    clips_dir = args.clips_dir if os.path.isabs(args.clips_dir) else os.path.join(project_root, args.clips_dir)
+    out_dir = args.out_dir if os.path.isabs(args.out_dir) else os.path.join(project_root, args.out_dir)
+    annotated_dir = os.path.join(out_dir, 'annotated')
+    os.makedirs(annotated_dir, exist_ok=True)
+
+    stems = args.stems or feature_stems(out_dir)
+    for stem in stems:
+        stem = os.path.splitext(stem)[0]
+        clip_path = os.path.join(clips_dir, f"{stem}.avi")
+        feat_path = find_features(out_dir, stem)
+        if not os.path.isfile(clip_path) or feat_path is None:
+            print(f"⚠️  Falta el clip o las features de '{stem}', se omite.")
+            continue
+        try:
+            render_clip(clip_path, feat_path, os.path.join(annotated_dir, f"{stem}_annot.avi"))
+        except ValueError as e:
+            print(f"❌ {e}")
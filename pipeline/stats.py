@@ -0,0 +1,200 @@
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+
+# Permitir ejecutar el script directamente (python pipeline/stats.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from pipeline.codec import feature_stems, find_features, load_features
+from pipeline.lector import LAYOUT
+from pipeline.store import FeatureStore
+
+CACHE_DIR = '.stats_cache'
+CHUNK_FRAMES = 1024
+# Landmarks con estadísticas: los de cada slot de mano y los de la cara, cada uno con (x, y, z)
+NUM_POINTS = LAYOUT.num_hands * LAYOUT.hand_landmarks + LAYOUT.face_landmarks
+
+class Moments:
+    """
+    Momentos por landmark y coordenada: número de muestras (frames con ese landmark
+    detectado), media y M2 (Welford), mínimo y máximo. Se combinan con la fórmula
+    de Chan, así el resultado no depende de cómo se trocee el corpus.
+    """
+    def __init__(self, count=None, mean=None, m2=None, lo=None, hi=None):
+        self.count = np.zeros(NUM_POINTS) if count is None else count
+        self.mean = np.zeros((NUM_POINTS, 3)) if mean is None else mean
+        self.m2 = np.zeros((NUM_POINTS, 3)) if m2 is None else m2
+        self.lo = np.full((NUM_POINTS, 3), np.inf) if lo is None else lo
+        self.hi = np.full((NUM_POINTS, 3), -np.inf) if hi is None else hi
+
+    @classmethod
+    def from_chunk(cls, frames: np.ndarray) -> 'Moments':
+        hands = LAYOUT.hands(frames)[..., :3].reshape(len(frames), -1, 3)
+        values = np.concatenate([hands, LAYOUT.face(frames)], axis=1).astype(np.float64)
+        hand_mask = np.repeat(LAYOUT.hand_presence(frames), LAYOUT.hand_landmarks, axis=1)
+        face_mask = np.repeat(LAYOUT.face_presence(frames)[:, None], LAYOUT.face_landmarks, axis=1)
+        mask = np.concatenate([hand_mask, face_mask], axis=1)[..., None]
+        count = mask[..., 0].sum(axis=0).astype(np.float64)
+        safe = np.maximum(count, 1)[:, None]
+        mean = np.where(mask, values, 0).sum(axis=0) / safe
+        m2 = (np.where(mask, values - mean, 0) ** 2).sum(axis=0)
+        lo = np.where(mask, values, np.inf).min(axis=0)
+        hi = np.where(mask, values, -np.inf).max(axis=0)
+        return cls(count, mean, m2, lo, hi)
+
+    def merge(self, other: 'Moments') -> None:
+        total = self.count + other.count
+        safe = np.maximum(total, 1)[:, None]
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count[:, None] / safe)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count)[:, None] / safe
+        self.count = total
+        self.lo = np.minimum(self.lo, other.lo)
+        self.hi = np.maximum(self.hi, other.hi)
+
+    def variance(self) -> np.ndarray:
+        return np.where(self.count[:, None] > 0, self.m2 / np.maximum(self.count, 1)[:, None], np.nan)
+
+    def arrays(self) -> dict:
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'lo': self.lo, 'hi': self.hi}
+
+_stores = {}  # FeatureStore abiertos en este proceso (el índice se lee una sola vez)
+
+def _open_source(source):
+    if source[0] == 'store':
+        if source[1] not in _stores:
+            _stores[source[1]] = FeatureStore(source[1])
+        return _stores[source[1]].clip(source[2])
+    return load_features(source[1])
+
+def clip_stats(job) -> tuple:
+    """
+    Estadísticas de un clip, leído por bloques de CHUNK_FRAMES frames.
+    Si el caché del clip tiene la misma clave se reutiliza sin leer las features.
+    Devuelve (nombre, resumen, ruta del .npz con sus momentos).
+    """
+    name, source, key, cache_path = job
+    if os.path.isfile(cache_path):
+        with np.load(cache_path) as cached:
+            if str(cached['key']) == key:
+                return name, json.loads(str(cached['summary'])), cache_path
+    frames = _open_source(source)
+    moments = Moments()
+    hand_hits = np.zeros(LAYOUT.num_hands)
+    face_hits = 0
+    for start in range(0, len(frames), CHUNK_FRAMES):
+        chunk = np.asarray(frames[start:start + CHUNK_FRAMES])
+        moments.merge(Moments.from_chunk(chunk))
+        hand_hits += LAYOUT.hand_presence(chunk).sum(axis=0)
+        face_hits += int(LAYOUT.face_presence(chunk).sum())
+    n = len(frames)
+    detected = moments.count > 0
+    summary = {
+        'frames': n,
+        'hand_detection_rate': (hand_hits / max(n, 1)).tolist(),
+        'face_detection_rate': face_hits / max(n, 1),
+        'range_min': moments.lo[detected].min(axis=0).tolist() if detected.any() else None,
+        'range_max': moments.hi[detected].max(axis=0).tolist() if detected.any() else None,
+    }
+    np.savez(cache_path, key=key, summary=json.dumps(summary), **moments.arrays())
+    return name, summary, cache_path
+
+def _jobs(features_dir: str = None, store_dir: str = None, cache_dir: str = None) -> list:
+    jobs = []
+    if store_dir:
+        store = FeatureStore(store_dir)
+        for name, entry in store.clips.items():
+            # El almacén es de solo añadir: offset y longitud identifican el contenido
+            key = f"store:{entry['offset']}:{entry['length']}"
+            jobs.append((name, ('store', store_dir, name), key, os.path.join(cache_dir, f"{name}.npz")))
+    else:
+        for name in feature_stems(features_dir):
+            path = find_features(features_dir, name)
+            st = os.stat(path)
+            key = f"{os.path.splitext(path)[1][1:]}:{st.st_size}:{st.st_mtime_ns}"
+            jobs.append((name, ('file', path), key, os.path.join(cache_dir, f"{name}.npz")))
+    return jobs
+
+def corpus_stats(
+    report_path: str,
+    features_dir: str = None,
+    store_dir: str = None,
+    workers: int = None
+) -> dict:
+    """
+    Calcula las estadísticas de todo el corpus (los .npy/.kpz de `features_dir` o un
+    FeatureStore en `store_dir`) y las escribe en `report_path` como JSON:
+    - por clip: frames, tasas de detección de cada mano y de la cara y rango de coordenadas;
+    - global: las mismas tasas y, por landmark, media y varianza (solo frames con detección).
+    Los clips se procesan en paralelo y por bloques; el caché por clip evita releer los
+    que no cambiaron. La memoria no depende del tamaño del corpus.
+    """
+    cache_dir = os.path.join(os.path.dirname(report_path), CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    jobs = _jobs(features_dir, store_dir, cache_dir)
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    start = time.perf_counter()
+
+    total = Moments()
+    clips = {}
+    frames = 0
+    hand_hits = np.zeros(LAYOUT.num_hands)
+    face_hits = 0.0
+
+    def accumulate(result):
+        nonlocal frames, face_hits, hand_hits
+        name, summary, cache_path = result
+        clips[name] = summary
+        n = summary['frames']
+        frames += n
+        hand_hits = hand_hits + np.asarray(summary['hand_detection_rate']) * n
+        face_hits += summary['face_detection_rate'] * n
+        with np.load(cache_path) as cached:
+            total.merge(Moments(*(cached[k] for k in ('count', 'mean', 'm2', 'lo', 'hi'))))
+
+    if workers <= 1:
+        for job in jobs:
+            accumulate(clip_stats(job))
+    else:
+        with Pool(processes=workers) as pool:
+            for result in pool.imap_unordered(clip_stats, jobs, chunksize=8):
+                accumulate(result)
+
+    detected = total.count > 0
+    report = {
+        'clips': len(clips),
+        'frames': frames,
+        'hand_detection_rate': (hand_hits / max(frames, 1)).tolist(),
+        'face_detection_rate': face_hits / max(frames, 1),
+        'range_min': total.lo[detected].min(axis=0).tolist() if detected.any() else None,
+        'range_max': total.hi[detected].max(axis=0).tolist() if detected.any() else None,
+        # Landmarks en orden: mano derecha (21), mano izquierda (21), cara (468)
+        'landmark_samples': total.count.astype(int).tolist(),
+        'landmark_mean': np.where(detected[:, None], total.mean, None).tolist(),
+        'landmark_var': np.where(detected[:, None], total.variance(), None).tolist(),
+        'per_clip': dict(sorted(clips.items())),
+    }
+    tmp = report_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    os.replace(tmp, report_path)
+    print(f"Estadísticas de {len(clips)} clips ({frames} frames) en {time.perf_counter() - start:.1f}s "
+          f"-> {report_path}")
+    return report
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Estadísticas del corpus de features en un informe JSON.')
+    parser.add_argument('--features_dir', default='output', help='Directorio con los .npy por clip')
+    parser.add_argument('--store_dir', default=None, help='Usar un FeatureStore en lugar de los .npy')
+    parser.add_argument('--report', default='output/stats_report.json', help='Ruta del informe JSON')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Número de procesos en paralelo')
+    args = parser.parse_args()
+    resolve = lambda p: p if p is None or os.path.isabs(p) else os.path.join(project_root, p)
+    corpus_stats(resolve(args.report), features_dir=resolve(args.features_dir),
+                 store_dir=resolve(args.store_dir), workers=args.workers)
@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import numpy as np
+
+# Permitir ejecutar el script directamente (python pipeline/store.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from pipeline.codec import feature_stems, find_features, load_features
+from pipeline.dataset import load_labels
+
+DATA_NAME = 'features.f32'
+INDEX_NAME = 'index.json'
+
+class FeatureStore:
+    """
+    Almacén del corpus de features en un único fichero float32 contiguo
+    (frames de todos los clips, uno tras otro) más un índice JSON con, por clip,
+    el offset y la longitud en frames y su etiqueta.
+    El fichero se abre con memmap: leer un clip o un rango de frames es O(1) y
+    devuelve una vista sin copias; el corpus completo nunca se carga en RAM.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self.data_path = os.path.join(root, DATA_NAME)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.num_features = None
+        self.total_frames = 0
+        self.clips = {}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self.num_features = index['num_features']
+            self.total_frames = index['total_frames']
+            self.clips = index['clips']
+        self._data = None
+
+    def __len__(self):
+        return len(self.clips)
+
+    def __contains__(self, name):
+        return name in self.clips
+
+    def names(self) -> list:
+        return list(self.clips)
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        Todo el corpus como array (total_frames, num_features) mapeado en memoria.
+        """
+        if self._data is None:
+            if self.total_frames == 0:
+                return np.empty((0, self.num_features or 0), dtype=np.float32)
+            self._data = np.memmap(self.data_path, dtype=np.float32, mode='r',
+                                   shape=(self.total_frames, self.num_features))
+        return self._data
+
+    def clip(self, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Vista (sin copia) de los frames [start:stop] del clip `name`.
+        """
+        entry = self.clips[name]
+        start, stop, _ = slice(start, stop).indices(entry['length'])
+        return self.data[entry['offset'] + start:entry['offset'] + stop]
+
+    def label(self, name: str):
+        return self.clips[name].get('label')
+
+    def labels(self) -> dict:
+        return {name: entry.get('label') for name, entry in self.clips.items()}
+
+    def set_label(self, name: str, label) -> None:
+        self.clips[name]['label'] = label
+
+    def append(self, name: str, frames: np.ndarray, label=None, save: bool = True) -> None:
+        """
+        Añade al final del fichero los frames de un clip y lo registra en el índice.
+        Con `save=False` el índice no se escribe (útil al añadir muchos clips seguidos;
+        llamar a save_index() al terminar).
+        """
+        if name in self.clips:
+            raise ValueError(f"El clip '{name}' ya está en el almacén")
+        frames = np.ascontiguousarray(frames, dtype=np.float32)
+        if frames.ndim != 2:
+            raise ValueError(f"Se esperaba un array (frames, features), no {frames.shape}")
+        if self.num_features is None:
+            self.num_features = frames.shape[1]
+        elif frames.shape[1] != self.num_features:
+            raise ValueError(f"'{name}' tiene {frames.shape[1]} features y el almacén {self.num_features}")
+        os.makedirs(self.root, exist_ok=True)
+        # Escribir justo tras el último frame indexado: si una escritura anterior se
+        # interrumpió antes de guardar el índice, sus bytes huérfanos se sobrescriben
+        self._data = None
+        with open(self.data_path, 'r+b' if os.path.isfile(self.data_path) else 'wb') as f:
+            f.seek(self.total_frames * self.num_features * 4)
+            f.write(frames.tobytes())
+            f.truncate()
+        self.clips[name] = {'offset': self.total_frames, 'length': len(frames), 'label': label}
+        self.total_frames += len(frames)
+        if save:
+            self.save_index()
+
+    def save_index(self) -> None:
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'num_features': self.num_features,
+                'total_frames': self.total_frames,
+                'clips': self.clips,
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.index_path)
+
+def build_store(features_dir: str, labels_json: str, store_dir: str) -> FeatureStore:
+    """
+    Añade al almacén los .npy/.kpz de `features_dir` que aún no estén, con su etiqueta
+    de `labels_json` si la tienen, y actualiza las etiquetas de los ya presentes.
+    El almacén es de solo añadir: los clips ya presentes no se reescriben.
+    """
+    store = FeatureStore(store_dir)
+    labels = load_labels(labels_json) if os.path.isfile(labels_json) else {}
+    added = 0
+    for stem in feature_stems(features_dir):
+        if stem in store:
+            store.set_label(stem, labels.get(stem, store.label(stem)))
+            continue
+        frames = load_features(find_features(features_dir, stem))
+        store.append(stem, frames, labels.get(stem), save=False)
+        added += 1
+    store.save_index()
+    print(f"Almacén en {store_dir}: {len(store)} clips, {store.total_frames} frames ({added} nuevos)")
+    return store
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Construye/actualiza el almacén memmap de features.')
+    parser.add_argument('--features_dir', default='output', help='Directorio con los .npy por clip')
+    parser.add_argument('--labels', default='data/labels.json', help='Archivo JSON de etiquetas')
+    parser.add_argument('--store_dir', default='output/store', help='Directorio del almacén')
+    args = parser.parse_args()
+    resolve = lambda p: p if os.path.isabs(p) else os.path.join(project_root, p)
+    build_store(resolve(args.features_dir), resolve(args.labels), resolve(args.store_dir))
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# Permitir ejecutar el script directamente (python pipeline/train.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.model import GestureClassifier
+from pipeline.augment import augmented_batches
+from pipeline.codec import find_features
+from pipeline.dataset import dataset_fingerprint, labeled_clips
+from pipeline.render import read_metadata
+from pipeline.store import FeatureStore
+
+CACHE_DIR = '.design_cache'
+
+def _labeled_sources(features_dir: str, labels_json: str, store_dir: str = None):
+    """
+    Devuelve (huella, lista de (nombre, frames, etiqueta)) del dataset etiquetado,
+    desde un FeatureStore si se indica o desde los .npy de `features_dir`.
+    Los frames son memmaps: todavía no se ha leído nada del disco.
+    """
+    if store_dir:
+        store = FeatureStore(store_dir)
+        clips = [(name, store.clip(name), store.label(name)) for name in store.names() if store.label(name)]
+        fingerprint = [[name, label, store.clips[name]['offset'], len(frames)] for name, frames, label in clips]
+        return fingerprint, clips
+    return dataset_fingerprint(features_dir, labels_json), list(labeled_clips(features_dir, labels_json))
+
+def _clip_aspect(features_dir: str, stem: str, default: float = None) -> float:
+    """
+    Relación ancho/alto del vídeo del que salieron las features de `stem`: `default`
+    si se indica, si no la del .json de las features y, sin ella, 1.0.
+    """
+    if default:
+        return default
+    path = find_features(features_dir, stem) if features_dir else None
+    meta = read_metadata(path) if path else {}
+    if meta.get('width') and meta.get('height'):
+        return meta['width'] / meta['height']
+    return 1.0
+
+def build_design_matrix(features_dir: str, labels_json: str, cache_dir: str, store_dir: str = None) -> tuple:
+    """
+    Construye (X, y) con una fila por frame de cada clip etiquetado. X se reserva de una
+    vez y se rellena clip a clip desde los memmaps. El resultado se guarda en `cache_dir`
+    con una clave derivada del manifest del dataset y las etiquetas; si ya existe se
+    abre con mmap sin reconstruirlo.
+    """
+    fingerprint, clips = _labeled_sources(features_dir, labels_json, store_dir)
+    if not clips:
+        raise ValueError("No hay clips etiquetados con features")
+    key = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:16]
+    x_path = os.path.join(cache_dir, f"{key}_X.npy")
+    y_path = os.path.join(cache_dir, f"{key}_y.npy")
+    if os.path.isfile(x_path) and os.path.isfile(y_path):
+        print(f"Matriz de diseño en caché: {x_path}")
+        return np.load(x_path, mmap_mode='r'), np.load(y_path)
+
+    n_rows = sum(len(frames) for _, frames, _ in clips)
+    X = np.empty((n_rows, clips[0][1].shape[1]), dtype=np.float32)
+    y = np.empty(n_rows, dtype=object)
+    row = 0
+    for _, frames, label in clips:
+        X[row:row + len(frames)] = frames
+        y[row:row + len(frames)] = label
+        row += len(frames)
+    y = y.astype(str)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(x_path, X)
+    np.save(y_path, y)
+    print(f"Matriz de diseño {X.shape} de {len(clips)} clips guardada en {x_path}")
+    return X, y
+
+def measure_predict_latency(classifier: GestureClassifier, X: np.ndarray, n: int = 200) -> dict:
+    """
+    Latencia de GestureClassifier.predict sobre un solo vector (como en vivo), en ms.
+    """
+    rng = np.random.default_rng(0)
+    rows = np.asarray(X[np.sort(rng.integers(0, len(X), size=min(n, len(X))))])
+    classifier.predict(rows[0])  # calentamiento
+    times = []
+    for row in rows:
+        start = time.perf_counter()
+        classifier.predict(row)
+        times.append((time.perf_counter() - start) * 1000)
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+def train(
+    features_dir: str,
+    labels_json: str,
+    model_path: str,
+    store_dir: str = None,
+    n_jobs: int = -1,
+    augment_batches: int = 0,
+    batch_size: int = 4096,
+    trees_per_batch: int = 10,
+    aspect: float = None
+) -> dict:
+    """
+    Entrena el GestureClassifier de punta a punta y guarda junto al modelo
+    (<modelo>.metrics.json) el tiempo de ajuste, el tamaño del modelo y la latencia
+    por predicción. Devuelve esas métricas.
+    Con `augment_batches` > 0 no se construye la matriz de diseño: se entrena con
+    ese número de lotes aumentados sobre la marcha (pipeline.augment), cada uno de
+    `batch_size` frames y `trees_per_batch` árboles, con memoria constante. Las
+    rotaciones usan la relación ancho/alto de cada clip (de su .json) salvo que se
+    fije `aspect`.
+    """
+    classifier = GestureClassifier(model_path=model_path)
+    if augment_batches:
+        _, clips = _labeled_sources(features_dir, labels_json, store_dir)
+        if not clips:
+            raise ValueError("No hay clips etiquetados con features")
+        samples = 0
+        def counted(batches):
+            nonlocal samples
+            for X, y in batches:
+                samples += len(X)
+                yield X, y
+        sources = [(frames, label, _clip_aspect(None if store_dir else features_dir, name, aspect))
+                   for name, frames, label in clips]
+        start = time.perf_counter()
+        classifier.train_batches(counted(augmented_batches(sources, augment_batches, batch_size)),
+                                 trees_per_batch, n_jobs=n_jobs)
+        fit_seconds = time.perf_counter() - start
+        # Latencia medida con frames reales, sin aumentar
+        X = np.asarray(clips[0][1])
+        classes = sorted({str(label) for _, _, label in clips})
+    else:
+        cache_dir = os.path.join(store_dir or features_dir, CACHE_DIR)
+        X, y = build_design_matrix(features_dir, labels_json, cache_dir, store_dir)
+        start = time.perf_counter()
+        classifier.train(X, y, n_jobs=n_jobs)
+        fit_seconds = time.perf_counter() - start
+        samples = int(X.shape[0])
+        classes = sorted(set(y.tolist()))
+    metrics = {
+        'samples': samples,
+        'augmented': bool(augment_batches),
+        'features': int(X.shape[1]),
+        'classes': classes,
+        'fit_seconds': fit_seconds,
+        'model_bytes': os.path.getsize(model_path),
+        'predict_latency': measure_predict_latency(classifier, X),
+    }
+    metrics_path = os.path.splitext(model_path)[0] + '.metrics.json'
+    with open(metrics_path, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2)
+    lat = metrics['predict_latency']
+    print(f"Ajuste {fit_seconds:.1f}s, modelo {metrics['model_bytes'] / 1e6:.1f} MB, "
+          f"predict p50 {lat['p50_ms']:.2f} ms / p95 {lat['p95_ms']:.2f} ms -> {metrics_path}")
+    return metrics
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Entrena el GestureClassifier con los clips etiquetados.')
+    parser.add_argument('--features_dir', default='output', help='Directorio con los .npy por clip')
+    parser.add_argument('--labels', default='data/labels.json', help='Archivo JSON de etiquetas')
+    parser.add_argument('--store_dir', default=None, help='Usar un FeatureStore en lugar de los .npy')
+    parser.add_argument('--model', default='src/model.joblib', help='Ruta de salida del modelo')
+    parser.add_argument('--n_jobs', type=int, default=-1, help='Núcleos para el ajuste (-1 = todos)')
+    parser.add_argument('--augment_batches', type=int, default=0,
+                        help='Entrenar con este número de lotes aumentados sobre la marcha (0 = sin aumento)')
+    parser.add_argument('--batch_size', type=int, default=4096, help='Frames por lote aumentado')
+    parser.add_argument('--trees_per_batch', type=int, default=10, help='Árboles que añade cada lote aumentado')
+    parser.add_argument('--aspect', type=float, default=None,
+                        help='Ancho/alto de los vídeos para rotar en el aumento (por defecto, el del .json de cada clip)')
+    parser.add_argument('--max_latency_ms', type=float, default=None,
+                        help='Fallar (código 1) si la latencia p95 por predicción supera este valor')
+    args = parser.parse_args()
+    resolve = lambda p: p if p is None or os.path.isabs(p) else os.path.join(project_root, p)
+    metrics = train(resolve(args.features_dir), resolve(args.labels), resolve(args.model),
+                    store_dir=resolve(args.store_dir), n_jobs=args.n_jobs,
+                    augment_batches=args.augment_batches, batch_size=args.batch_size,
+                    trees_per_batch=args.trees_per_batch, aspect=args.aspect)
+    if args.max_latency_ms is not None and metrics['predict_latency']['p95_ms'] > args.max_latency_ms:
+        print(f"❌ Latencia p95 {metrics['predict_latency']['p95_ms']:.2f} ms > {args.max_latency_ms} ms")
+        sys.exit(1)
@@ -0,0 +1,51 @@
+import os
+import sys
+
+# Permitir ejecutar el script directamente (python pipeline/train_sequence.py)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import numpy as np
+
+from src.model import SequenceClassifier
+from pipeline.augment import augment_clip
+from pipeline.dataset import labeled_clips
+from pipeline.train import _clip_aspect
+
+def train_sequence(features_dir: str, labels_json: str, model_path: str, window: int, stride: int,
+                   augment: int = 0, seed: int = 0) -> SequenceClassifier:
+    """
+    Entrena un SequenceClassifier con los .npy de `features_dir` etiquetados en `labels_json`.
+    Con `augment` > 0 añade esas variantes aumentadas de cada clip (deformación temporal
+    incluida: aquí el ritmo sí importa, cada ventana conserva el orden de sus frames).
+    """
+    rng = np.random.default_rng(seed)
+    clips, labels = [], []
+    for stem, frames, label in labeled_clips(features_dir, labels_json):
+        if len(frames) < window:
+            print(f"⚠️  '{stem}' tiene {len(frames)} frames (< ventana {window}), se omite.")
+            continue
+        clips.append(frames)
+        labels.append(label)
+        aspect = _clip_aspect(features_dir, stem) if augment else None
+        for _ in range(augment):
+            clips.append(augment_clip(frames, rng, aspect=aspect))
+            labels.append(label)
+    classifier = SequenceClassifier(model_path=model_path, window=window, stride=stride)
+    classifier.train(clips, labels)
+    return classifier
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Entrena el clasificador secuencial por ventanas.')
+    parser.add_argument('--features_dir', default='output', help='Directorio con los .npy por clip')
+    parser.add_argument('--labels', default='data/labels.json', help='Archivo JSON de etiquetas')
+    parser.add_argument('--model', default='src/sequence_model.joblib', help='Ruta de salida del modelo')
+    parser.add_argument('--window', type=int, default=16, help='Frames por ventana')
+    parser.add_argument('--stride', type=int, default=4, help='Frames entre ventanas (y entre predicciones en vivo)')
+    parser.add_argument('--augment', type=int, default=0, help='Variantes aumentadas por clip (0 = sin aumento)')
+    args = parser.parse_args()
+    resolve = lambda p: p if os.path.isabs(p) else os.path.join(project_root, p)
+    train_sequence(resolve(args.features_dir), resolve(args.labels), resolve(args.model), args.window, args.stride,
+                   augment=args.augment)
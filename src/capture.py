@@ -1,3 +1,6 @@
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import mediapipe as mp
 import numpy as np
@@ -6,67 +9,447 @@ mp_hands = mp.solutions.hands
 mp_face = mp.solutions.face_mesh
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
+from mediapipe.framework.formats import landmark_pb2
+
+# Importable como src.capture (pipeline) y como capture (desde src/, p.ej. main.py)
+try:
+    from .layout import (FEATURE_LAYOUT_VERSION, HAND_SIDES, HAND_LANDMARKS, FACE_LANDMARKS, HAND_SIZE,
+                         FACE_OFFSET, NUM_FEATURES)
+except ImportError:
+    from layout import (FEATURE_LAYOUT_VERSION, HAND_SIDES, HAND_LANDMARKS, FACE_LANDMARKS, HAND_SIZE,
+                        FACE_OFFSET, NUM_FEATURES)
+
+# Parámetros que no cambian el contenido de las features (no cuentan para el manifest)
+_RUNTIME_PARAMS = ('parallel', 'metrics')
+
+def extractor_settings(**kwargs):
+    """
+    Devuelve los ajustes efectivos (valores por defecto + kwargs) de un
+    KeypointExtractor construido con `kwargs`, sin crear los grafos de MediaPipe.
+    Sirve para decidir si unas features guardadas siguen siendo válidas.
+    """
+    params = inspect.signature(KeypointExtractor.__init__).parameters
+    settings = {name: p.default for name, p in params.items() if name != 'self'}
+    settings.update(kwargs)
+    for name in _RUNTIME_PARAMS:
+        settings.pop(name, None)
+    settings['layout_version'] = FEATURE_LAYOUT_VERSION
+    return settings
 
 class KeypointExtractor:
-    def __init__(self, mode=True, maxHands=2, detectionCon=0.2, trackCon=0.2):
+    """
+    Extrae el vector de keypoints de manos y cara de cada frame.
+    mode=True detecta en cada frame; mode=False sigue los landmarks entre frames
+    (llamar a reset() al cambiar de vídeo). Las demás opciones ahorran inferencia y
+    se describen junto a su estado en __init__. Liberar con close().
+    """
+    def __init__(self, mode=True, maxHands=2, detectionCon=0.2, trackCon=0.2, modelComplexity=1,
+                 faceDetectionCon=0.5, faceTrackCon=0.5, redetectEvery=0, redetectCon=0.0,
+                 parallel=False, maxInputSize=None, faceEvery=1, faceChangeThreshold=0.0,
+                 gateThreshold=0.0, gateRefresh=30, handRoi=False, roiMargin=0.5, roiRefresh=15,
+                 metrics=None):
+        if handRoi and not mode:
+            raise ValueError("handRoi requiere mode=True: en modo vídeo MediaPipe ya sigue la región de las manos")
         # Activar static_image_mode para detección en cada frame
         self.hands = mp_hands.Hands(
             static_image_mode=mode,
             max_num_hands=maxHands,
-            model_complexity=1,
+            model_complexity=modelComplexity,
             min_detection_confidence=detectionCon,
-            min_tracking_confidence=trackCon
+            # MediaPipe vuelve a detectar cuando la presencia de la mano seguida baja de
+            # este umbral: es la señal de pérdida de seguimiento que usa redetectCon
+            min_tracking_confidence=max(trackCon, redetectCon)
         )
         self.face = mp_face.FaceMesh(
             static_image_mode=mode,
             max_num_faces=1,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
+            min_detection_confidence=faceDetectionCon,
+            min_tracking_confidence=faceTrackCon
         )
         self.maxHands = maxHands
+        self.mode = mode
+        # Modo vídeo: re-detección de las manos cada `redetectEvery` frames (0 = nunca);
+        # `redetectCon` actúa a través de min_tracking_confidence (ver arriba)
+        self.redetectEvery = redetectEvery
+        self.redetectCon = redetectCon
+        # Lado mayor máximo de la imagen que recibe MediaPipe; las coordenadas son
+        # normalizadas, así que el vector de features no cambia de escala
+        self.maxInputSize = maxInputSize
+        # Cadencia de la cara (las manos van en todos los frames): FaceMesh como mucho
+        # cada `faceEvery` frames, o antes si la región de la cara cambia más de
+        # `faceChangeThreshold` (diferencia media de gris, 0-255). En los intermedios se
+        # repite la última cara y `face_inferred` queda a False (en lote, interpolate_face)
+        self.faceEvery = faceEvery
+        self.faceChangeThreshold = faceChangeThreshold
+        self.face_inferred = True
+        # Compuerta: si la miniatura en gris del frame difiere del último inferido menos
+        # de `gateThreshold` (0-255) se reutilizan sus keypoints sin MediaPipe (`inferred`
+        # a False); cada `gateRefresh` frames se infiere siempre
+        self.gateThreshold = gateThreshold
+        self.gateRefresh = gateRefresh
+        self.inferred = True
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self._gate_thumb = None
+        self._gate_age = 0
+        self._last_kp = None
+        # Spans extract.* y contadores por frame (src.metrics.Metrics); None = sin medir
+        self.metrics = metrics
+        # Solo en modo estático: Hands sobre un recorte a resolución original de la caja de
+        # las manos anteriores, ampliada `roiMargin` por lado; se vuelve al frame completo
+        # si se pierde una mano o cada `roiRefresh` frames
+        self.handRoi = handRoi
+        self.roiMargin = roiMargin
+        self.roiRefresh = roiRefresh
+        self.roi_fallbacks = 0
+        self._prev_hands = None  # (N, 2) x, y normalizados de las manos del frame anterior
+        self._prev_hand_count = 0
+        self._roi_age = 0
+        self._face_age = faceEvery  # frames desde la última inferencia de la cara
+        self._last_face = None
+        self._face_box = None
+        self._face_patch = None
+        self._frames_tracked = 0
+        # Segundos de cada grafo en el último frame
+        self.timings = {'hands': 0.0, 'face': 0.0}
+        # parallel: Hands y FaceMesh a la vez, en un hilo propio por grafo
+        self._hands_worker = self._face_worker = None
+        if parallel:
+            self._hands_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hands')
+            self._face_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='face')
+        self.settings = extractor_settings(
+            mode=mode, maxHands=maxHands, detectionCon=detectionCon,
+            trackCon=trackCon, modelComplexity=modelComplexity,
+            faceDetectionCon=faceDetectionCon, faceTrackCon=faceTrackCon,
+            redetectEvery=redetectEvery, redetectCon=redetectCon, maxInputSize=maxInputSize,
+            faceEvery=faceEvery, faceChangeThreshold=faceChangeThreshold,
+            gateThreshold=gateThreshold, gateRefresh=gateRefresh,
+            handRoi=handRoi, roiMargin=roiMargin, roiRefresh=roiRefresh
+        )
+
+    def close(self):
+        """
+        Libera los grafos de MediaPipe y los hilos de inferencia.
+        """
+        for worker in (self._hands_worker, self._face_worker):
+            if worker is not None:
+                worker.shutdown(wait=True)
+        self._hands_worker = self._face_worker = None
+        self.hands.close()
+        self.face.close()
+
+    @staticmethod
+    def _timed(graph, image):
+        start = time.perf_counter()
+        result = graph.process(image)
+        return result, time.perf_counter() - start
+
+    def reset(self):
+        """
+        Descarta el estado de seguimiento para que el siguiente frame se detecte desde cero.
+        En modo estático no hay estado y no hace nada.
+        """
+        if not self.mode:
+            # Reiniciar el grafo es la única forma de forzar la detección en la API de soluciones
+            self.hands.reset()
+            self.face.reset()
+        self._frames_tracked = 0
+        self._face_age = self.faceEvery
+        self._last_face = self._face_box = self._face_patch = None
+        self._gate_thumb = self._last_kp = None
+        self._prev_hands = None
+        self._prev_hand_count = self._roi_age = 0
 
-    def extract(self, frame):
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        res_hands = self.hands.process(image)
-        res_face = self.face.process(image)
-        if res_hands.multi_hand_landmarks:
-            for hand_landmarks in res_hands.multi_hand_landmarks:
-                mp_drawing.draw_landmarks(
-                    frame, hand_landmarks, mp_hands.HAND_CONNECTIONS,
-                    mp_drawing_styles.get_default_hand_landmarks_style(),
-                    mp_drawing_styles.get_default_hand_connections_style()
-                )
-        if res_face.multi_face_landmarks:
-            for face_landmarks in res_face.multi_face_landmarks:
-                mp_drawing.draw_landmarks(
-                    frame, face_landmarks, mp_face.FACEMESH_TESSELATION,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_tesselation_style()
-                )
-                mp_drawing.draw_landmarks(
-                    frame, face_landmarks, mp_face.FACEMESH_CONTOURS,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_contours_style()
-                )
-        kp = []
-        # Manos: slots fijos [Right, Left] con bit de presencia (x, y, z, p)
+    @property
+    def skip_rate(self):
+        """
+        Fracción de frames resueltos por la compuerta sin ejecutar MediaPipe.
+        """
+        return self.frames_skipped / self.frames_seen if self.frames_seen else 0.0
+
+    def _gate(self, frame):
+        """
+        Devuelve True si `frame` es casi idéntico al último inferido y se puede saltar.
+        """
+        thumb = cv2.cvtColor(cv2.resize(frame, (32, 24), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        thumb = thumb.astype(np.float32)
+        if (self._gate_thumb is not None and self._last_kp is not None and self._gate_age < self.gateRefresh
+                and np.abs(thumb - self._gate_thumb).mean() <= self.gateThreshold):
+            self._gate_age += 1
+            return True
+        # Se compara siempre con el último frame inferido, así los cambios lentos no se acumulan
+        self._gate_thumb = thumb
+        self._gate_age = 1
+        return False
+
+    def _region_patch(self, image, box):
+        # Miniatura en gris de la región `box` (normalizada) para detectar cambios baratos
+        h, w = image.shape[:2]
+        x0, y0, x1, y1 = box
+        crop = image[int(y0 * h):max(int(y1 * h), int(y0 * h) + 1), int(x0 * w):max(int(x1 * w), int(x0 * w) + 1)]
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _face_due(self, image):
+        if self._face_age >= self.faceEvery:
+            return True
+        if self.faceChangeThreshold and self._face_box is not None:
+            diff = np.abs(self._region_patch(image, self._face_box) - self._face_patch).mean()
+            return diff > self.faceChangeThreshold
+        return False
+
+    def _remember_face(self, image, face):
+        self._face_age = 1
+        self._last_face = face
+        self._face_box = self._face_patch = None
+        if face is not None and self.faceChangeThreshold:
+            lo = np.clip(face[:, :2].min(axis=0) - 0.02, 0, 1)
+            hi = np.clip(face[:, :2].max(axis=0) + 0.02, 0, 1)
+            if (hi > lo).all():
+                self._face_box = (lo[0], lo[1], hi[0], hi[1])
+                self._face_patch = self._region_patch(image, self._face_box)
+
+    def _roi_box(self, frame):
+        """
+        Caja (x0, y0, x1, y1) en píxeles del frame original alrededor de las manos del
+        frame anterior, cuadrada y ampliada; None si toca detectar en el frame completo.
+        """
+        if self._prev_hands is None or self._roi_age >= self.roiRefresh:
+            return None
+        h, w = frame.shape[:2]
+        lo = self._prev_hands.min(axis=0) * (w, h)
+        hi = self._prev_hands.max(axis=0) * (w, h)
+        side = max(hi - lo) * (1 + 2 * self.roiMargin)
+        if side >= min(w, h):
+            return None
+        side = max(side, 64)
+        cx, cy = (lo + hi) / 2
+        x0 = int(np.clip(cx - side / 2, 0, w - side))
+        y0 = int(np.clip(cy - side / 2, 0, h - side))
+        return x0, y0, x0 + int(side), y0 + int(side)
+
+    def _parse_hands(self, res_hands):
         hand_sides = {}
         if res_hands.multi_hand_landmarks and res_hands.multi_handedness:
             for lm_list, hd in zip(res_hands.multi_hand_landmarks, res_hands.multi_handedness):
                 label = hd.classification[0].label  # 'Right' o 'Left'
-                hand_sides[label] = lm_list
-        for side in ['Right', 'Left']:
-            lm_list = hand_sides.get(side)
-            if lm_list:
-                for lm in lm_list.landmark:
-                    kp.extend([lm.x, lm.y, lm.z, 1])  # presencia=1
+                hand_sides[label] = landmarks_to_array(lm_list)
+        return hand_sides
+
+    def extract(self, frame, draw=True, out=None):
+        """
+        Devuelve el vector de keypoints (NUM_FEATURES,) float32 del frame (BGR).
+        Con `draw=True` dibuja además las manos y la malla facial sobre `frame`;
+        con `draw=False` no se hace ningún trabajo de dibujo.
+        Si se pasa `out` (p.ej. una fila de un array del clip) se escribe ahí sin copias.
+        """
+        start = time.perf_counter() if self.metrics is not None else None
+        self.frames_seen += 1
+        self.inferred = not (self.gateThreshold and self._gate(frame))
+        if not self.inferred:
+            self.frames_skipped += 1
+            self.face_inferred = False
+            self.timings['hands'] = self.timings['face'] = 0.0
+            if out is None:
+                kp = self._last_kp.copy()
             else:
-                kp.extend([0.0, 0.0, 0.0, 0] * 21)
-        # Cara
-        if res_face.multi_face_landmarks:
-            face_lm = res_face.multi_face_landmarks[0]
-            for lm in face_lm.landmark:
-                kp.extend([lm.x, lm.y, lm.z])
+                kp = out
+                kp[:] = self._last_kp
+            return self._finish(frame, kp, draw, start)
+        if not self.mode:
+            if self.redetectEvery and self._frames_tracked >= self.redetectEvery:
+                # Solo las manos: la cara y el estado de compuerta, cadencia y ROI siguen valiendo
+                self.hands.reset()
+                self._frames_tracked = 0
+            self._frames_tracked += 1
+        image = frame
+        if self.maxInputSize:
+            h, w = frame.shape[:2]
+            scale = self.maxInputSize / max(h, w)
+            if scale < 1:
+                image = cv2.resize(frame, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        roi = self._roi_box(frame) if self.handRoi else None
+        hands_image = image
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            hands_image = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        self.face_inferred = self._face_due(image)
+        res_face, self.timings['face'] = None, 0.0
+        if self._hands_worker is not None:
+            hands_job = self._hands_worker.submit(self._timed, self.hands, hands_image)
+            if self.face_inferred:
+                res_face, self.timings['face'] = self._face_worker.submit(self._timed, self.face, image).result()
+            res_hands, self.timings['hands'] = hands_job.result()
         else:
-            kp.extend([0] * (468 * 3))  # relleno si no detecta
-        return np.array(kp)
+            res_hands, self.timings['hands'] = self._timed(self.hands, hands_image)
+            if self.face_inferred:
+                res_face, self.timings['face'] = self._timed(self.face, image)
+        hand_sides = self._parse_hands(res_hands)
+        if roi is not None:
+            if len(hand_sides) < self._prev_hand_count:
+                # Alguna mano se salió del recorte: volver a detectar en el frame completo
+                self.roi_fallbacks += 1
+                res_hands, seconds = self._timed(self.hands, image)
+                self.timings['hands'] += seconds
+                hand_sides = self._parse_hands(res_hands)
+                roi = None
+            else:
+                # Coordenadas del recorte -> coordenadas normalizadas del frame completo
+                h, w = frame.shape[:2]
+                scale = np.array([(x1 - x0) / w, (y1 - y0) / h, (x1 - x0) / w], dtype=np.float32)
+                for points in hand_sides.values():
+                    points *= scale
+                    points[:, 0] += x0 / w
+                    points[:, 1] += y0 / h
+        if self.handRoi:
+            self._roi_age = self._roi_age + 1 if roi is not None else 1
+            self._prev_hand_count = len(hand_sides)
+            self._prev_hands = np.concatenate([p[:, :2] for p in hand_sides.values()]) if hand_sides else None
+        if self.face_inferred:
+            face = None
+            if res_face.multi_face_landmarks:
+                face = landmarks_to_array(res_face.multi_face_landmarks[0])
+            self._remember_face(image, face)
+        else:
+            # Frame sin FaceMesh: se mantiene la última cara inferida
+            face = self._last_face
+            self._face_age += 1
+        kp = pack_keypoints(hand_sides, face, out)
+        if self.gateThreshold:
+            self._last_kp = kp.copy()
+        return self._finish(frame, kp, draw, start, len(hand_sides), face is not None)
+
+    def _finish(self, frame, kp, draw, start, num_hands=0, face_found=False):
+        # Dibujo opcional y, si hay instrumentación, registro de tiempos y detecciones
+        m = self.metrics
+        if m is None:
+            if draw:
+                draw_keypoints(frame, kp)
+            return kp
+        if draw:
+            with m.span('extract.draw'):
+                draw_keypoints(frame, kp)
+        m.observe('extract.total', time.perf_counter() - start)
+        m.count('extract.frames')
+        if not self.inferred:
+            m.count('extract.gated')
+            return kp
+        m.observe('extract.hands', self.timings['hands'])
+        m.count('extract.hand_hits', num_hands)
+        if self.face_inferred:
+            m.observe('extract.face', self.timings['face'])
+            m.count('extract.face_hits', int(face_found))
+        return kp
+
+
+# Cada NormalizedLandmark con solo x, y, z se serializa como un registro fijo de 17 bytes:
+# cabecera del submensaje (tag 0x0a, longitud 15) y tres floats little-endian con su tag
+_LANDMARK_RECORD = np.dtype([
+    ('msg', 'u1', 2), ('tx', 'u1'), ('x', '<f4'), ('ty', 'u1'), ('y', '<f4'), ('tz', 'u1'), ('z', '<f4')
+])
+_LANDMARK_TAGS = (0x0a, 0x0f, 0x0d, 0x15, 0x1d)
+
+def landmarks_to_array(landmark_list):
+    """
+    Convierte una NormalizedLandmarkList de MediaPipe en un array (N, 3) float32.
+    Decodifica el mensaje serializado de una vez en vez de leer cada campo desde Python;
+    si el formato no es el esperado (p.ej. con visibility) recurre a la lectura campo a campo.
+    """
+    n = len(landmark_list.landmark)
+    raw = landmark_list.SerializeToString()
+    if len(raw) == n * _LANDMARK_RECORD.itemsize:
+        rec = np.frombuffer(raw, dtype=_LANDMARK_RECORD)
+        tags = (rec['msg'][:, 0], rec['msg'][:, 1], rec['tx'], rec['ty'], rec['tz'])
+        if all((t == expected).all() for t, expected in zip(tags, _LANDMARK_TAGS)):
+            out = np.empty((n, 3), dtype=np.float32)
+            out[:, 0] = rec['x']
+            out[:, 1] = rec['y']
+            out[:, 2] = rec['z']
+            return out
+    coords = np.fromiter(
+        (v for lm in landmark_list.landmark for v in (lm.x, lm.y, lm.z)), dtype=np.float32, count=3 * n
+    )
+    return coords.reshape(-1, 3)
+
+def pack_keypoints(hands, face, out=None):
+    """
+    Escribe el vector de features con layout fijo en `out` (o en un buffer nuevo).
+    - hands: dict {'Right'|'Left': array (21, 3)} con las manos detectadas.
+    - face: array (468, 3) o None si no hay cara.
+    Los slots ausentes quedan a cero (presencia=0).
+    """
+    if out is None:
+        out = np.empty(NUM_FEATURES, dtype=np.float32)
+    elif out.shape != (NUM_FEATURES,) or out.dtype != np.float32 or not out.flags.c_contiguous:
+        raise ValueError(f"`out` debe ser un array float32 contiguo de forma ({NUM_FEATURES},)")
+    hand_view = out[:FACE_OFFSET].reshape(len(HAND_SIDES), HAND_LANDMARKS, 4)
+    for i, side in enumerate(HAND_SIDES):
+        points = hands.get(side)
+        if points is None:
+            hand_view[i] = 0
+        else:
+            hand_view[i, :, :3] = points
+            hand_view[i, :, 3] = 1  # presencia
+    face_view = out[FACE_OFFSET:].reshape(FACE_LANDMARKS, 3)
+    if face is None:
+        face_view[:] = 0  # relleno si no detecta
+    else:
+        face_view[:] = face
+    return out
+
+def interpolate_face(features, filled):
+    """
+    Rellena en el sitio la cara de las filas `filled` (índices o máscara booleana de
+    frames en los que no se ejecutó FaceMesh) de un clip (frames, NUM_FEATURES),
+    interpolando linealmente entre los frames inferidos anterior y siguiente cuando
+    ambos tienen cara. Si no, se conserva el valor repetido de la última cara.
+    """
+    n = len(features)
+    filled = np.asarray(filled)
+    filled = np.flatnonzero(filled) if filled.dtype == bool else filled.astype(np.int64)
+    if not len(filled):
+        return features
+    inferred = np.setdiff1d(np.arange(n), filled)
+    face = features[:, FACE_OFFSET:]
+    nxt = np.searchsorted(inferred, filled)
+    ok = (nxt > 0) & (nxt < len(inferred))
+    rows = filled[ok]
+    prev, nxt = inferred[nxt[ok] - 1], inferred[nxt[ok]]
+    both = face[prev].any(axis=1) & face[nxt].any(axis=1)
+    rows, prev, nxt = rows[both], prev[both], nxt[both]
+    t = ((rows - prev) / (nxt - prev)).astype(np.float32)[:, None]
+    face[rows] = face[prev] * (1 - t) + face[nxt] * t
+    return features
+
+def _to_landmark_list(points):
+    return landmark_pb2.NormalizedLandmarkList(
+        landmark=[landmark_pb2.NormalizedLandmark(x=x, y=y, z=z) for x, y, z in points.tolist()]
+    )
+
+def draw_keypoints(frame, kp):
+    """
+    Dibuja sobre `frame` (in situ) las manos y la malla facial codificadas en un
+    vector de keypoints. Permite anotar vídeos a posteriori a partir de un .npy.
+    """
+    for h in range(len(HAND_SIDES)):
+        hand = np.asarray(kp[h * HAND_SIZE:(h + 1) * HAND_SIZE]).reshape(HAND_LANDMARKS, 4)
+        if hand[0, 3] > 0:
+            mp_drawing.draw_landmarks(
+                frame, _to_landmark_list(hand[:, :3]), mp_hands.HAND_CONNECTIONS,
+                mp_drawing_styles.get_default_hand_landmarks_style(),
+                mp_drawing_styles.get_default_hand_connections_style()
+            )
+    face = np.asarray(kp[FACE_OFFSET:]).reshape(FACE_LANDMARKS, 3)
+    if face.any():
+        face_landmarks = _to_landmark_list(face)
+        mp_drawing.draw_landmarks(
+            frame, face_landmarks, mp_face.FACEMESH_TESSELATION,
+            landmark_drawing_spec=None,
+            connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_tesselation_style()
+        )
+        mp_drawing.draw_landmarks(
+            frame, face_landmarks, mp_face.FACEMESH_CONTOURS,
+            landmark_drawing_spec=None,
+            connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_contours_style()
+        )
@@ -1,36 +1,178 @@
 import cv2
+import json
 import os
+import queue
+import threading
+import numpy as np
 from datetime import datetime
+from time import time
 
 class ClipRecorder:
-    def __init__(self, output_dir="../data/clips", max_frames=80):
+    """
+    Graba clips desde el bucle en vivo sin bloquearlo.
+    - Los frames se copian a un buffer circular preasignado de (pre_roll + max_frames)
+      frames, reservado con el primer frame: la memoria de grabación tiene un tope fijo.
+    - Con `pre_roll` > 0 se conservan siempre los últimos `pre_roll` frames, de modo que
+      al empezar a grabar (start) el clip incluye lo ocurrido justo antes.
+    - save_clip() solo copia el clip y lo encola; la codificación XVID la hace un hilo
+      en segundo plano con una cola acotada a `queue_size` clips.
+    - Si add_frame recibe también los keypoints del frame, junto a cada clip se guardan
+      keypoints/<clip>.npy y keypoints/<clip>.json (con `settings`, los ajustes del
+      extractor, y `face_filled`, los frames cuya cara se repitió sin pasar por FaceMesh),
+      para que el pipeline no tenga que volver a extraerlos.
+    - Si add_frame recibe el instante de captura de cada frame, el clip se escribe a la
+      frecuencia real a la que llegaron (p. ej. solo los frames inferidos) en vez de a
+      `fps`, que queda como valor por defecto.
+    """
+    def __init__(self, output_dir="../data/clips", max_frames=80, pre_roll=0, fps=20.0, queue_size=4,
+                 settings=None):
         self.output_dir = output_dir
+        # Subcarpeta para que el etiquetador no liste los .npy como clips
+        self.keypoints_dir = os.path.join(output_dir, 'keypoints')
         os.makedirs(self.output_dir, exist_ok=True)
+        self.settings = settings
         self.max_frames = max_frames
-        self.frames = []
+        self.pre_roll = pre_roll
+        self.fps = fps
+        self.capacity = pre_roll + max_frames
+        self.recording = False
+        self._buffer = None
+        self._keypoints = None
+        self._has_keypoints = np.zeros(self.capacity, dtype=bool)
+        self._face_inferred = np.ones(self.capacity, dtype=bool)
+        self._timestamps = np.full(self.capacity, np.nan)
+        self._head = 0       # siguiente posición a escribir
+        self._count = 0      # frames válidos en el buffer (pre-roll incluido)
+        self._recorded = 0   # frames añadidos desde start()
         self._last_full_msg_time = None
+        self.failed = 0      # clips que no se pudieron escribir
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write_clips, name='clip-writer', daemon=True)
+        self._writer.start()
 
-    def add_frame(self, frame):
-        from time import time
-        now = time()
-        if len(self.frames) < self.max_frames:
-            self.frames.append(frame)
-        else:
+    def __len__(self):
+        return self._count
+
+    def start(self):
+        """
+        Empieza un clip nuevo conservando el pre-roll acumulado.
+        """
+        self.recording = True
+        self._recorded = 0
+        self._count = min(self._count, self.pre_roll)
+
+    def stop(self):
+        self.recording = False
+        self._count = min(self._count, self.pre_roll)
+
+    def add_frame(self, frame, keypoints=None, face_inferred=True, timestamp=None):
+        if not self.recording and self.pre_roll == 0:
+            return
+        if self.recording and self._recorded >= self.max_frames:
+            now = time()
             if self._last_full_msg_time is None or (now - self._last_full_msg_time) >= 1.5:
                 print("Alcanzado el número máximo de frames de clip")
                 self._last_full_msg_time = now
+            return
+        if self._buffer is None or self._buffer.shape[1:] != frame.shape:
+            self._buffer = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+            self._head = self._count = 0
+        self._buffer[self._head] = frame
+        if keypoints is not None:
+            if self._keypoints is None or self._keypoints.shape[1] != len(keypoints):
+                self._keypoints = np.zeros((self.capacity, len(keypoints)), dtype=np.float32)
+                self._has_keypoints[:] = False
+            self._keypoints[self._head] = keypoints
+        self._has_keypoints[self._head] = keypoints is not None
+        self._face_inferred[self._head] = face_inferred
+        self._timestamps[self._head] = np.nan if timestamp is None else timestamp
+        self._head = (self._head + 1) % self.capacity
+        if self.recording:
+            self._recorded += 1
+            self._count += 1
+        else:
+            self._count = min(self._count + 1, self.pre_roll)
+
+    def _ordered(self, buffer):
+        # Índices del más antiguo al más reciente
+        idx = (self._head - self._count + np.arange(self._count)) % self.capacity
+        return buffer[idx]
+
+    def _clip_fps(self):
+        # Frecuencia media entre el primer y el último frame si todos traen instante de captura
+        timestamps = self._ordered(self._timestamps)
+        if len(timestamps) < 2 or np.isnan(timestamps).any() or timestamps[-1] <= timestamps[0]:
+            return self.fps
+        return float((len(timestamps) - 1) / (timestamps[-1] - timestamps[0]))
 
     def save_clip(self):
-        if not self.frames:
+        if self._count == 0:
             print("No hay frames para guardar")
             return
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         clip_path = os.path.join(self.output_dir, f"clip_{timestamp}.avi")
-        h, w, _ = self.frames[0].shape
+        keypoints = face_filled = None
+        if self._keypoints is not None and self._ordered(self._has_keypoints).all():
+            keypoints = self._ordered(self._keypoints)
+            face_filled = np.flatnonzero(~self._ordered(self._face_inferred)).tolist()
+        try:
+            self._queue.put_nowait((clip_path, self._ordered(self._buffer), keypoints, face_filled,
+                                    self._clip_fps()))
+        except queue.Full:
+            print("⚠️  El guardado de clips va retrasado; este clip se descarta")
+            return
+        self._count = 0
+        self._recorded = 0
+        print(f"Guardando clip en {clip_path}...")
+
+    def _write_clips(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            clip_path, frames, keypoints, face_filled, fps = item
+            # Un fallo (disco lleno, permisos...) se informa y se pierde solo ese clip:
+            # el hilo sigue atendiendo la cola
+            try:
+                self._write_clip(clip_path, frames, keypoints, face_filled, fps)
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ No se pudo guardar {clip_path}: {type(e).__name__}: {e}")
+
+    def _write_clip(self, clip_path, frames, keypoints, face_filled, fps):
+        if keypoints is not None:
+            # Los keypoints se escriben antes que el vídeo: si el .avi existe, ya están
+            self._write_keypoints(clip_path, keypoints, face_filled, frames[0].shape, fps)
+        h, w, _ = frames[0].shape
         fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        out = cv2.VideoWriter(clip_path, fourcc, 20.0, (w, h))
-        for f in self.frames:
-            out.write(f)
-        out.release()
-        self.frames = []
-        print(f"Clip guardado en {clip_path}")
\ No newline at end of file
+        out = cv2.VideoWriter(clip_path, fourcc, fps, (w, h))
+        if not out.isOpened():
+            raise OSError("no se pudo abrir el vídeo de salida")
+        try:
+            for f in frames:
+                out.write(f)
+        finally:
+            out.release()
+        print(f"Clip guardado en {clip_path}")
+
+    def _write_keypoints(self, clip_path, keypoints, face_filled, frame_shape, fps):
+        os.makedirs(self.keypoints_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(clip_path))[0]
+        np.save(os.path.join(self.keypoints_dir, f"{stem}.npy"), keypoints)
+        meta = {'frames': len(keypoints), 'fps': fps, 'width': frame_shape[1], 'height': frame_shape[0],
+                'face_filled': face_filled, 'settings': self.settings}
+        with open(os.path.join(self.keypoints_dir, f"{stem}.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    def close(self, timeout=30.0):
+        """
+        Espera (hasta `timeout` segundos) a que terminen de escribirse los clips pendientes.
+        """
+        if self._writer.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self._writer.join(timeout)
+        if self._writer.is_alive():
+            print(f"⚠️  Quedan {self._queue.qsize()} clips sin guardar al cerrar")
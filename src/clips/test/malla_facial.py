@@ -1,6 +1,15 @@
+import argparse
+import os
+import sys
 import cv2
 import mediapipe as mp
 
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.sources import open_source
+
 mp_face_mesh = mp.solutions.face_mesh
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
@@ -10,8 +19,10 @@ IMPORTANT_IDXS = [1, 4, 2, 5, 10, 33, 133, 55, 65, 93, 199, 61, 291, 285, 295, 3
 draw_spec = mp_drawing.DrawingSpec(color=(255,255,255), thickness=1, circle_radius=1)
 highlight_spec = {'color': (255, 0, 255), 'radius': 3}
 
-def main():
-    cap = cv2.VideoCapture(0)
+def main(source='0', headless=False):
+    # Webcam, vídeo o directorio de clips (ver src/sources.py)
+    cap = open_source(source)
+    frames = detected = 0
     with mp_face_mesh.FaceMesh(
         max_num_faces=1,
         refine_landmarks=True,
@@ -25,6 +36,10 @@ def main():
             image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             image.flags.writeable = False
             results = face_mesh.process(image)
+            frames += 1
+            detected += bool(results.multi_face_landmarks)
+            if headless:
+                continue
             image.flags.writeable = True
             image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
 
@@ -48,7 +63,13 @@ def main():
                 break
 
     cap.release()
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
+    print(f"Cara detectada en {detected}/{frames} frames")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Muestra la malla facial y resalta los puntos clave.')
+    parser.add_argument('--source', default='0', help='Índice de cámara, vídeo o directorio de clips')
+    parser.add_argument('--headless', action='store_true', help='Sin ventana: solo contar detecciones')
+    args = parser.parse_args()
+    main(args.source, args.headless)
@@ -8,13 +8,16 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 sys.path.insert(0, project_root)
 
 from src.capture import KeypointExtractor
+from src.sources import open_source
 
 
 def main(
     max_samples: int = 100,
-    threshold: float = 0.2
+    threshold: float = 0.2,
+    source: str = '0'
 ):
-    cap = cv2.VideoCapture(0)
+    # Webcam por defecto; también acepta un vídeo o un directorio de clips
+    cap = open_source(source)
     extractor = KeypointExtractor(mode=True, maxHands=2, detectionCon=0.2, trackCon=0.2)
     samples = []
     print(f"Buscando {max_samples} frames con más de {threshold*100:.0f}% de detección...")
@@ -64,4 +67,4 @@ def main(
     print(f"Guardado resumen en: {json_path}")
 
 if __name__ == '__main__':
-    main()
+    main(source=sys.argv[1] if len(sys.argv) > 1 else '0')
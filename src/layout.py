@@ -0,0 +1,13 @@
+# Layout del vector de features por frame, compartido por la extracción (src/capture.py)
+# y la lectura offline (pipeline/lector.py). Sin dependencias: importarlo no carga MediaPipe.
+
+# Versión del layout del vector de features; incrementarla cuando cambie su contenido
+FEATURE_LAYOUT_VERSION = 2  # v2: float32
+
+# Layout del vector: manos en slots fijos [Right, Left] con (x, y, z, presencia), luego cara (x, y, z)
+HAND_SIDES = ('Right', 'Left')
+HAND_LANDMARKS = 21
+FACE_LANDMARKS = 468
+HAND_SIZE = HAND_LANDMARKS * 4
+FACE_OFFSET = len(HAND_SIDES) * HAND_SIZE
+NUM_FEATURES = FACE_OFFSET + FACE_LANDMARKS * 3  # 1572
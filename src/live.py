@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatestFrameCapture:
+    """
+    Lee frames de una fuente tipo cv2.VideoCapture en un hilo propio y guarda solo
+    el más reciente (con su instante de captura), de modo que nunca se acumulan
+    frames atrasados en el buffer de la cámara.
+    """
+    def __init__(self, cap):
+        self.cap = cap
+        self.frame = None
+        self.timestamp = 0.0
+        self.seq = 0
+        self.running = True
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='capture', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            now = time.perf_counter()
+            with self._cond:
+                if not ret:
+                    self.running = False
+                else:
+                    self.frame, self.timestamp = frame, now
+                    self.seq += 1
+                self._cond.notify_all()
+
+    def latest(self):
+        """
+        Devuelve (seq, frame, timestamp) del último frame capturado sin esperar.
+        """
+        with self._cond:
+            return self.seq, self.frame, self.timestamp
+
+    def wait_newer(self, seq, timeout=1.0):
+        """
+        Espera a que haya un frame posterior a `seq` y lo devuelve como latest().
+        Si la fuente se agota devuelve el último disponible.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > seq or not self.running, timeout)
+            return self.seq, self.frame, self.timestamp
+
+    def stop(self):
+        self.running = False
+        self._thread.join(timeout=2.0)
+        self.cap.release()
+
+
+class LatencyStats:
+    """
+    Ventana deslizante de latencias (segundos) con percentiles p50/p95.
+    """
+    def __init__(self, window=300):
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentiles(self):
+        if not self.samples:
+            return None, None
+        p50, p95 = np.percentile(np.fromiter(self.samples, dtype=float), [50, 95])
+        return float(p50), float(p95)
+
+
+class LiveResult:
+    def __init__(self, seq, frame, timestamp, keypoints, label, face_inferred=True):
+        self.seq = seq
+        self.frame = frame
+        self.timestamp = timestamp
+        self.keypoints = keypoints
+        self.label = label
+        self.face_inferred = face_inferred
+
+
+class LiveEngine:
+    """
+    Motor de traducción en vivo con latencia acotada:
+    - un hilo de captura que conserva solo el frame más nuevo (LatestFrameCapture),
+    - un hilo de inferencia que procesa siempre el último frame disponible,
+    - el bucle de visualización del llamador, que consulta latest_result() sin bloquearse
+      (o espera cada resultado nuevo con wait_result() si no hay nada que mostrar).
+    Los frames que llegan mientras la inferencia está ocupada se descartan (`dropped`).
+    """
+    def __init__(self, cap, extractor, classifier=None):
+        self.extractor = extractor
+        self.classifier = classifier
+        self.translate = classifier is not None
+        self.capture = LatestFrameCapture(cap)
+        self.latency = LatencyStats()
+        self.dropped = 0
+        self._result = None
+        self._rendered_seq = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._infer, name='inference', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self.capture.running
+
+    def _infer(self):
+        last_seq = 0
+        while self.capture.running:
+            seq, frame, timestamp = self.capture.wait_newer(last_seq)
+            if seq == last_seq or frame is None:
+                continue
+            if last_seq:
+                self.dropped += seq - last_seq - 1
+            last_seq = seq
+            kp = self.extractor.extract(frame, draw=False)
+            label = None
+            if self.translate:
+                try:
+                    label = self.classifier.predict(kp)
+                except Exception:
+                    label = '?'
+            with self._cond:
+                self._result = LiveResult(seq, frame, timestamp, kp, label,
+                                          getattr(self.extractor, 'face_inferred', True))
+                self._cond.notify_all()
+        with self._cond:
+            self._cond.notify_all()
+
+    def latest_result(self):
+        """
+        Devuelve el último LiveResult (o None) sin esperar a la inferencia.
+        """
+        with self._cond:
+            return self._result
+
+    def wait_result(self, seq, timeout=1.0):
+        """
+        Espera a que se publique un resultado posterior al frame `seq` y lo devuelve
+        (el último disponible, o None, si vence `timeout` o la fuente se agota).
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: (self._result is not None and self._result.seq > seq)
+                                or not self._thread.is_alive(), timeout)
+            return self._result
+
+    def mark_rendered(self, result):
+        """
+        Registra la latencia extremo a extremo (captura -> predicción mostrada)
+        la primera vez que se muestra cada resultado.
+        """
+        if result is not None and result.seq != self._rendered_seq:
+            self._rendered_seq = result.seq
+            self.latency.add(time.perf_counter() - result.timestamp)
+
+    def stop(self):
+        self.capture.stop()
+        self._thread.join(timeout=2.0)
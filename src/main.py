@@ -1,57 +1,160 @@
+import argparse
+import time
 import cv2
-from capture import KeypointExtractor
+from capture import KeypointExtractor, draw_keypoints
 from clips.recorder import ClipRecorder
+from live import LiveEngine
+from metrics import NullMetrics, create_metrics
 from model import GestureClassifier
+from sources import open_source
 
 
 def main():
-    cap = cv2.VideoCapture(0)
-    extractor = KeypointExtractor(maxHands=2)
-    recorder = ClipRecorder(output_dir="../data/clips", max_frames=80)
-    classifier = GestureClassifier(model_path="model.joblib")
+    parser = argparse.ArgumentParser(description='Traducción de lengua de señas en vivo.')
+    parser.add_argument('--source', default='0',
+                        help='Índice de cámara, vídeo (reproducido a su fps) o directorio de clips (en bucle)')
+    parser.add_argument('--loop', action='store_true', help='Repetir el vídeo de --source al terminar')
+    parser.add_argument('--headless', action='store_true',
+                        help='Sin ventana ni teclado: solo inferencia y estadísticas (servidores sin pantalla)')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Segundos a ejecutar antes de salir (por defecto hasta agotar la fuente)')
+    parser.add_argument('--metrics_log', default=None,
+                        help="Añadir métricas periódicas en líneas JSON a este fichero ('-' = stderr)")
+    parser.add_argument('--metrics_file', default=None,
+                        help='Fichero de texto con las últimas métricas, reescrito en cada periodo')
+    parser.add_argument('--metrics_interval', type=float, default=5.0, help='Segundos entre exportaciones (0 = solo un resumen al salir)')
+    args = parser.parse_args()
+    # Sin exportadores la instrumentación queda desactivada (metrics=None en el hot path)
+    metrics = create_metrics(args.metrics_log, args.metrics_file, args.metrics_interval)
+    loop_metrics = metrics or NullMetrics()
+
+    cap = open_source(args.source, loop=True if args.loop else None)
+    # Modo vídeo: seguimiento entre frames con re-detección periódica;
+    # Hands y FaceMesh en paralelo para que la latencia sea la del grafo más lento.
+    # La cara se mueve poco al signar: FaceMesh cada 3 frames o antes si su región cambia.
+    # Los frames casi idénticos al anterior reutilizan sus keypoints sin inferencia
+    extractor = KeypointExtractor(mode=False, maxHands=2, redetectEvery=60, redetectCon=0.5,
+                                  parallel=True, faceEvery=3, faceChangeThreshold=8.0,
+                                  gateThreshold=2.0, gateRefresh=15, metrics=metrics)
+    # Conserva 10 frames previos a pulsar 'r', guarda los clips en segundo plano
+    # y guarda también los keypoints ya extraídos para no repetir la extracción offline
+    recorder = ClipRecorder(output_dir="../data/clips", max_frames=80, pre_roll=10,
+                            settings=extractor.settings)
+    classifier = GestureClassifier(model_path="model.joblib", metrics=metrics)
     try:
         classifier.load()
     except Exception:
         print("No se encontró un modelo entrenado. Ejecuta el entrenamiento primero.")
+    # Captura e inferencia en hilos propios; este bucle solo muestra y nunca espera a la inferencia
+    engine = LiveEngine(cap, extractor, classifier)
     mode = 'translation'
-    print("Presiona 't' para traducir, 'r' para grabar clip, 's' para guardar clip, 'q' para salir.")
+    if args.headless:
+        print(f"Modo sin pantalla con la fuente '{args.source}'. Ctrl+C para salir.")
+    else:
+        print("Presiona 't' para traducir, 'r' para grabar clip, 's' para guardar clip, 'q' para salir.")
+
+    seq = 0
+    recorded_seq = 0
+    processed = 0
+    start = time.perf_counter()
+    try:
+        run_loop = True
+        while engine.running and run_loop:
+            if args.duration and time.perf_counter() - start >= args.duration:
+                break
+            seq, recorded_seq, processed, run_loop, mode = _step(
+                engine, recorder, loop_metrics, args.headless, seq, recorded_seq, processed, mode)
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - start
+    engine.stop()
+    extractor.close()
+    recorder.close()
+    loop_metrics.close()
+    if not args.headless:
+        cv2.destroyAllWindows()
+    print(f"{processed} frames inferidos en {elapsed:.1f}s ({processed / elapsed:.1f} fps), "
+          f"{engine.dropped} descartados por la inferencia, {getattr(cap, 'dropped', 0)} por retraso de lectura")
+    p50, p95 = engine.latency.percentiles()
+    if p50 is not None:
+        print(f"Latencia captura->predicción: p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
 
+def _step(engine, recorder, loop_metrics, headless, seq, recorded_seq, processed, mode):
+    """
+    Una iteración del bucle de visualización. Devuelve el estado actualizado
+    (seq, recorded_seq, processed, seguir, modo).
+    """
+    if headless:
+        # Sin nada que mostrar se espera a cada resultado y se marca al publicarse,
+        # así la latencia no incluye la espera al siguiente frame de captura
+        with loop_metrics.span('loop.wait'):
+            result = engine.wait_result(recorded_seq)
+        if result is not None and result.seq != recorded_seq:
+            recorded_seq = result.seq
+            processed += 1
+            loop_metrics.count('loop.frames')
+            engine.mark_rendered(result)
+        loop_metrics.gauge('live.dropped', engine.dropped)
+        return result.seq if result is not None else seq, recorded_seq, processed, True, mode
+    with loop_metrics.span('loop.wait'):
+        seq, frame, _ = engine.capture.wait_newer(seq)
+    if frame is None:
+        return seq, recorded_seq, processed, True, mode
+    loop_metrics.count('loop.frames')
+    result = engine.latest_result()
+    if result is not None and result.seq != recorded_seq:
+        processed += 1
+    # Copia: el hilo de inferencia puede estar leyendo este mismo frame
+    frame = frame.copy()
+
+    with loop_metrics.span('loop.waitkey'):
         key = cv2.waitKey(1) & 0xFF
-        if key == ord('r'):
-            mode = 'record'
-            recorder.frames = []
-            print("Modo grabación activado.")
-        elif key == ord('t'):
-            mode = 'translation'
-            print("Modo traducción activado.")
-        elif key == ord('s') and mode == 'record':
-            recorder.save_clip()
-        elif key == ord('q'):
-            break
-
-        kp = extractor.extract(frame)
-        if mode == 'translation':
-            try:
-                letter = classifier.predict(kp)
-            except Exception:
-                letter = '?'
-            cv2.putText(frame, str(letter), (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
+    if key == ord('r'):
+        mode = 'record'
+        engine.translate = False
+        recorder.start()
+        print("Modo grabación activado.")
+    elif key == ord('t'):
+        mode = 'translation'
+        engine.translate = True
+        recorder.stop()
+        print("Modo traducción activado.")
+    elif key == ord('s') and mode == 'record':
+        recorder.save_clip()
+    elif key == ord('q'):
+        return seq, recorded_seq, processed, False, mode
+
+    if result is not None:
+        with loop_metrics.span('loop.draw'):
+            draw_keypoints(frame, result.keypoints)
+        # Cada frame que pasa por la inferencia va al recorder, sin anotar y con sus keypoints
+        # (fuera de grabación solo se guarda el pre-roll); con su instante de captura el clip
+        # se escribe a la frecuencia de inferencia real y no sale acelerado
+        if result.seq != recorded_seq:
+            recorded_seq = result.seq
+            recorder.add_frame(result.frame, result.keypoints, result.face_inferred, result.timestamp)
+    if mode == 'translation':
+        if result is not None and result.label is not None:
+            cv2.putText(frame, str(result.label), (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
                         2, (0, 255, 0), 3)
-        elif mode == 'record':
-            recorder.add_frame(frame)
-            cv2.putText(frame,
-                        f"Grabando {len(recorder.frames)}/{recorder.max_frames}",
-                        (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
-                        1, (0, 0, 255), 2)
+            engine.mark_rendered(result)
+        p50, p95 = engine.latency.percentiles()
+        if p50 is not None:
+            loop_metrics.gauge('live.latency_p95_ms', p95 * 1000)
+            cv2.putText(frame, f"latencia p50 {p50 * 1000:.0f} ms / p95 {p95 * 1000:.0f} ms",
+                        (50, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 1)
+    elif mode == 'record':
+        cv2.putText(frame,
+                    f"Grabando {len(recorder)}/{recorder.capacity}",
+                    (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
+                    1, (0, 0, 255), 2)
 
+    with loop_metrics.span('loop.imshow'):
         cv2.imshow('LSP Translator', frame)
-    cap.release()
-    cv2.destroyAllWindows()
+    loop_metrics.gauge('live.dropped', engine.dropped)
+    return seq, recorded_seq, processed, True, mode
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullMetrics:
+    """
+    Instrumentación desactivada: mismos métodos que Metrics sin hacer nada.
+    Los componentes del hot path (KeypointExtractor, GestureClassifier, process_clip)
+    reciben `metrics=None` y ni siquiera llaman; esta clase es para bucles como el de
+    main(), donde es más cómodo llamar siempre.
+    """
+    def span(self, name):
+        return _NULL_SPAN
+
+    def observe(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def close(self):
+        pass
+
+
+class Metrics:
+    """
+    Registro de métricas con muy poco coste por evento:
+    - span(name) / observe(name, segundos): duraciones con nombre;
+    - count(name, n): contadores acumulados;
+    - gauge(name, valor): último valor de una magnitud (p.ej. frames descartados).
+    Cada `interval` segundos un hilo propio resume las duraciones de ese periodo
+    (llamadas, media, p50, p95, máximo) y lo entrega a los `exporters`.
+    Con `interval=0` no hay hilo y solo se exporta al cerrar (close).
+    Por periodo se guardan como mucho `max_samples` duraciones por span (las más
+    recientes, sobre las que se calculan media, percentiles y máximo; `calls` sigue
+    contando todas), así la memoria queda acotada aunque el periodo sea largo o no
+    se exporte nunca.
+    """
+    def __init__(self, exporters=(), interval=5.0, max_samples=10000):
+        self.exporters = list(exporters)
+        self.interval = interval
+        self.max_samples = max_samples
+        self._spans = {}
+        self._calls = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.exporters and interval:
+            self._thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+            self._thread.start()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            values = self._spans.get(name)
+            if values is None:
+                values = self._spans[name] = deque(maxlen=self.max_samples)
+            values.append(seconds)
+            self._calls[name] = self._calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        """
+        Devuelve el resumen del periodo actual y empieza uno nuevo.
+        Los contadores y gauges son acumulados; los spans, solo del periodo.
+        """
+        with self._lock:
+            spans, self._spans = self._spans, {}
+            calls, self._calls = self._calls, {}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        summary = {}
+        for name, values in spans.items():
+            ms = np.asarray(values) * 1000
+            p50, p95 = np.percentile(ms, [50, 95])
+            summary[name] = {'calls': calls[name], 'mean_ms': float(ms.mean()), 'p50_ms': float(p50),
+                             'p95_ms': float(p95), 'max_ms': float(ms.max())}
+        return {'time': time.time(), 'pid': os.getpid(), 'spans': summary,
+                'counters': counters, 'gauges': gauges}
+
+    def export(self):
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception as e:
+                print(f"⚠️  Error al exportar métricas con {type(exporter).__name__}: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def close(self):
+        """
+        Detiene el hilo de exportación y exporta lo pendiente.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self.exporters:
+            self.export()
+
+
+class JsonLogExporter:
+    """
+    Escribe cada resumen como una línea JSON, en `path` (añadiendo al final; varios
+    procesos pueden compartir el fichero) o en la salida de errores si no se indica.
+    """
+    def __init__(self, path=None):
+        self.path = path
+
+    def export(self, snapshot):
+        line = json.dumps(snapshot, ensure_ascii=False) + '\n'
+        if self.path is None:
+            sys.stderr.write(line)
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+class TextFileExporter:
+    """
+    Reescribe `path` con el último resumen en formato texto, una métrica por línea
+    ("nombre valor"), para consultarlo con tail/cat o un recolector externo.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, snapshot):
+        lines = [f"# {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['time']))} pid {snapshot['pid']}"]
+        for name, s in sorted(snapshot['spans'].items()):
+            for key in ('calls', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms'):
+                lines.append(f"span.{name}.{key} {s[key]:.6g}")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"counter.{name} {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f"gauge.{name} {value}")
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+
+
+def create_metrics(json_log=None, text_file=None, interval=5.0):
+    """
+    Construye un Metrics con los exportadores pedidos: `json_log` ('-' = stderr) y/o
+    `text_file`. Devuelve None si no se pide ninguno (instrumentación desactivada).
+    Con `interval` 0 solo se exporta un resumen al cerrar.
+    """
+    exporters = []
+    if json_log:
+        exporters.append(JsonLogExporter(None if json_log == '-' else json_log))
+    if text_file:
+        exporters.append(TextFileExporter(text_file))
+    return Metrics(exporters, interval) if exporters else None
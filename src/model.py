@@ -1,21 +1,61 @@
 import joblib
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 
+# Importable como src.model (pipeline) y como model (desde src/, p.ej. main.py)
+try:
+    from .layout import FACE_OFFSET
+except ImportError:
+    from layout import FACE_OFFSET
+
+# Slots de manos al inicio del vector de features (2 x 21 x (x, y, z, presencia))
+HAND_FEATURES = FACE_OFFSET
+
 class GestureClassifier:
-    def __init__(self, model_path="model.joblib"):
+    def __init__(self, model_path="model.joblib", metrics=None):
         self.model_path = model_path
         self.model = None
+        # Instrumentación opcional (src.metrics.Metrics): span 'predict' por llamada
+        self.metrics = metrics
 
-    def train(self, X, y):
+    def train(self, X, y, n_jobs=None):
         """
         Entrena el clasificador con X (features) e y (labels) y guarda el modelo.
+        `n_jobs` se usa solo para el ajuste (-1 = todos los núcleos); el modelo se
+        guarda sin paralelismo porque en vivo predice vector a vector y repartir
+        cada predicción entre hilos solo añade latencia.
         """
-        clf = RandomForestClassifier(n_estimators=100, random_state=42)
+        clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs)
         clf.fit(X, y)
+        clf.set_params(n_jobs=None)
         joblib.dump(clf, self.model_path)
         self.model = clf
         print(f"Modelo entrenado y guardado en {self.model_path}")
 
+    def train_batches(self, batches, trees_per_batch=10, n_jobs=None):
+        """
+        Entrena a partir de un iterable de lotes (X, y) sin reunirlos en memoria:
+        con warm_start cada lote añade `trees_per_batch` árboles ajustados solo con él.
+        Todos los lotes deben contener las mismas clases (los árboles ya ajustados
+        guardan índices de clase, no etiquetas).
+        """
+        clf = RandomForestClassifier(n_estimators=0, warm_start=True, random_state=42, n_jobs=n_jobs)
+        classes = None
+        for X, y in batches:
+            batch_classes = np.unique(y)
+            if classes is None:
+                classes = batch_classes
+            elif not np.array_equal(classes, batch_classes):
+                raise ValueError(f"El lote tiene las clases {batch_classes.tolist()} en lugar de {classes.tolist()}")
+            clf.set_params(n_estimators=clf.n_estimators + trees_per_batch)
+            clf.fit(X, y)
+        if classes is None:
+            raise ValueError("No hay lotes de entrenamiento")
+        clf.set_params(n_jobs=None, warm_start=False)
+        joblib.dump(clf, self.model_path)
+        self.model = clf
+        print(f"Modelo entrenado con {clf.n_estimators} árboles y guardado en {self.model_path}")
+
     def load(self):
         """
         Carga el modelo desde el archivo.
@@ -29,4 +69,130 @@ class GestureClassifier:
         """
         if self.model is None:
             self.load()
-        return self.model.predict([features])[0]
\ No newline at end of file
+        if self.metrics is None:
+            return self.model.predict([features])[0]
+        with self.metrics.span('predict'):
+            return self.model.predict([features])[0]
+
+
+def window_features(mean, sq_mean, first, last):
+    """
+    Vector temporal de una ventana a partir de sus momentos: media y desviación
+    típica de cada feature más el desplazamiento de las manos (último - primero).
+    Acepta arrays 1D (una ventana) o 2D (una ventana por fila).
+    """
+    std = np.sqrt(np.maximum(sq_mean - mean * mean, 0.0))
+    delta = last[..., :HAND_FEATURES] - first[..., :HAND_FEATURES]
+    return np.concatenate([mean, std, delta], axis=-1).astype(np.float32)
+
+def clip_window_features(frames, window, stride):
+    """
+    Features de todas las ventanas de `window` frames (avanzando `stride`) de un clip
+    (frames, num_features), calculadas de una vez con sumas acumuladas.
+    Devuelve un array (num_ventanas, dim), vacío si el clip es más corto que la ventana.
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    starts = np.arange(0, len(frames) - window + 1, stride)
+    if len(starts) == 0:
+        return np.empty((0, 2 * frames.shape[1] + HAND_FEATURES), dtype=np.float32)
+    zero = np.zeros((1, frames.shape[1]))
+    csum = np.concatenate([zero, np.cumsum(frames, axis=0)])
+    csq = np.concatenate([zero, np.cumsum(frames * frames, axis=0)])
+    ends = starts + window
+    mean = (csum[ends] - csum[starts]) / window
+    sq_mean = (csq[ends] - csq[starts]) / window
+    return window_features(mean, sq_mean, frames[starts], frames[ends - 1])
+
+class SequenceClassifier:
+    """
+    Clasificador de ventanas temporales de keypoints (capta el movimiento de letras
+    como J o Z). Guarda junto al modelo el tamaño de ventana y el paso usados.
+    """
+    def __init__(self, model_path="sequence_model.joblib", window=16, stride=4):
+        self.model_path = model_path
+        self.window = window
+        self.stride = stride
+        self.model = None
+
+    def train(self, clips, labels):
+        """
+        Entrena con una lista de arrays (frames, num_features) por clip y su etiqueta.
+        """
+        X, y = [], []
+        for frames, label in zip(clips, labels):
+            feats = clip_window_features(frames, self.window, self.stride)
+            X.append(feats)
+            y.extend([label] * len(feats))
+        if not X or not sum(len(feats) for feats in X):
+            raise ValueError(f"Ningún clip tiene al menos {self.window} frames")
+        X = np.concatenate(X)
+        clf = RandomForestClassifier(n_estimators=100, random_state=42)
+        clf.fit(X, y)
+        joblib.dump({'model': clf, 'window': self.window, 'stride': self.stride}, self.model_path)
+        self.model = clf
+        print(f"Modelo secuencial entrenado con {len(X)} ventanas y guardado en {self.model_path}")
+
+    def load(self):
+        """
+        Carga el modelo (y su ventana/paso) desde el archivo.
+        """
+        data = joblib.load(self.model_path)
+        self.model, self.window, self.stride = data['model'], data['window'], data['stride']
+        print(f"Modelo secuencial cargado desde {self.model_path}")
+
+    def predict_window(self, features):
+        """
+        Devuelve (etiqueta, confianza) para el vector de una ventana.
+        """
+        if self.model is None:
+            self.load()
+        proba = self.model.predict_proba([features])[0]
+        best = int(np.argmax(proba))
+        return self.model.classes_[best], float(proba[best])
+
+class StreamingRecognizer:
+    """
+    Reconocimiento en streaming: mantiene un buffer circular con los últimos
+    `window` frames y sus sumas (y sumas de cuadrados) acumuladas, que se actualizan
+    en O(num_features) por frame sumando el nuevo y restando el que sale, de modo que
+    las ventanas solapadas no se recalculan. Emite una predicción cada `stride` frames.
+    """
+    def __init__(self, classifier, stride=None):
+        if classifier.model is None:
+            classifier.load()
+        self.classifier = classifier
+        self.window = classifier.window
+        self.stride = stride or classifier.stride
+        self.buffer = None
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._sum = None
+        self._sq = None
+
+    def push(self, kp):
+        """
+        Añade el vector de un frame. Devuelve (etiqueta, confianza) cuando toca
+        emitir una predicción y None en el resto de frames.
+        """
+        kp = np.asarray(kp, dtype=np.float64)
+        if self.buffer is None or self.buffer.shape[1] != kp.shape[0]:
+            self.buffer = np.zeros((self.window, kp.shape[0]))
+        if self._sum is None:
+            self._sum = np.zeros(kp.shape[0])
+            self._sq = np.zeros(kp.shape[0])
+        slot = self.count % self.window
+        if self.count >= self.window:
+            old = self.buffer[slot]
+            self._sum -= old
+            self._sq -= old * old
+        self.buffer[slot] = kp
+        self._sum += kp
+        self._sq += kp * kp
+        self.count += 1
+        if self.count < self.window or (self.count - self.window) % self.stride:
+            return None
+        first = self.buffer[self.count % self.window]
+        feats = window_features(self._sum / self.window, self._sq / self.window, first, kp)
+        return self.classifier.predict_window(feats)
@@ -1,6 +1,6 @@
 import cv2
 import numpy as np
-from capture import KeypointExtractor
+from capture import KeypointExtractor, NUM_FEATURES
 
 def process_clip(
     clip_path: str,
@@ -14,7 +14,10 @@ def process_clip(
     """
     extractor = KeypointExtractor()
     cap = cv2.VideoCapture(clip_path)
-    features = []
+    # Buffer float32 del tamaño del clip; cada frame se escribe directamente en su fila
+    capacity = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1)
+    features = np.empty((capacity, NUM_FEATURES), dtype=np.float32)
+    n_frames = 0
     writer = None
 
     if annotated_video_path:
@@ -28,8 +31,11 @@ def process_clip(
         ret, frame = cap.read()
         if not ret:
             break
-        kp = extractor.extract(frame)
-        features.append(kp)
+        if n_frames == len(features):
+            # CAP_PROP_FRAME_COUNT es solo una estimación en algunos AVI
+            features = np.concatenate([features, np.empty_like(features)])
+        extractor.extract(frame, draw=writer is not None, out=features[n_frames])
+        n_frames += 1
         if writer:
             writer.write(frame)
 
@@ -37,8 +43,7 @@ def process_clip(
     if writer:
         writer.release()
 
-    arr = np.stack(features, axis=0)
-    np.save(output_features_path, arr)
+    np.save(output_features_path, features[:n_frames])
     print(f"Features guardadas en: {output_features_path}")
     if annotated_video_path:
         print(f"Vídeo anotado guardado en: {annotated_video_path}")
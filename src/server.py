@@ -0,0 +1,467 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import cv2
+import numpy as np
+
+from capture import HAND_SIDES, HAND_SIZE, FACE_OFFSET, KeypointExtractor
+from live import LatencyStats
+from metrics import NullMetrics, create_metrics
+from model import GestureClassifier
+from sources import open_source
+
+# Protocolo (TCP, un stream por conexión):
+# - cliente -> servidor: cabecera (seq, instante de envío del cliente, bytes) + frame JPEG;
+# - servidor -> cliente: longitud + JSON con la predicción de ese frame.
+# El instante se devuelve tal cual para que el cliente mida la latencia con su propio reloj.
+FRAME_HEADER = struct.Struct('!IdI')
+REPLY_HEADER = struct.Struct('!I')
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+
+def _recv_exact(sock, n):
+    """
+    Lee exactamente `n` bytes; devuelve None si la conexión se cierra antes.
+    Si el socket tiene timeout (el del envío en el servidor), esperar datos de un
+    cliente inactivo no es un error: se sigue esperando sin perder lo ya leído.
+    """
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        try:
+            chunk = sock.recv_into(view[got:], n - got)
+        except socket.timeout:
+            continue
+        if not chunk:
+            return None
+        got += chunk
+    return bytes(buf)
+
+
+def send_frame(sock, seq, sent, jpeg):
+    sock.sendall(FRAME_HEADER.pack(seq, sent, len(jpeg)) + jpeg)
+
+
+def recv_frame(sock):
+    """
+    Devuelve (seq, sent, jpeg) o None al cerrarse la conexión.
+    """
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    seq, sent, size = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame de {size} bytes, por encima del máximo ({MAX_FRAME_BYTES})")
+    jpeg = _recv_exact(sock, size)
+    return None if jpeg is None else (seq, sent, jpeg)
+
+
+def send_reply(sock, reply):
+    data = json.dumps(reply, ensure_ascii=False).encode('utf-8')
+    sock.sendall(REPLY_HEADER.pack(len(data)) + data)
+
+
+def recv_reply(sock):
+    header = _recv_exact(sock, REPLY_HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, REPLY_HEADER.unpack(header)[0])
+    return None if data is None else json.loads(data.decode('utf-8'))
+
+
+_worker_extractor = None
+_worker_classifier = None
+
+def _init_worker(extractor_kwargs=None, model_path=None):
+    global _worker_extractor, _worker_classifier
+    # Modo estático y sin reutilizar cara ni frames: un worker atiende frames de
+    # streams distintos, así que no puede arrastrar estado de un frame al siguiente
+    _worker_extractor = KeypointExtractor(mode=True, **(extractor_kwargs or {}))
+    if model_path and os.path.isfile(model_path):
+        _worker_classifier = GestureClassifier(model_path=model_path)
+        _worker_classifier.load()
+
+def _recognize(jpeg):
+    """
+    Extrae y clasifica un frame JPEG dentro de un worker. Nunca lanza excepciones:
+    los fallos se devuelven como texto para no tumbar el stream.
+    """
+    start = time.perf_counter()
+    try:
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("JPEG no válido")
+        kp = _worker_extractor.extract(frame, draw=False)
+        label = None
+        if _worker_classifier is not None:
+            label = str(_worker_classifier.predict(kp))
+        hands = sum(bool(kp[i * HAND_SIZE + 3]) for i in range(len(HAND_SIDES)))
+        face = bool(kp[FACE_OFFSET:].any())
+        return {'label': label, 'hands': hands, 'face': face,
+                'infer_ms': (time.perf_counter() - start) * 1000, 'error': None}
+    except Exception as e:
+        return {'label': None, 'hands': 0, 'face': False,
+                'infer_ms': (time.perf_counter() - start) * 1000, 'error': f"{type(e).__name__}: {e}"}
+
+
+class _Stream:
+    def __init__(self, stream_id, sock, reply_queue):
+        self.id = stream_id
+        self.sock = sock
+        self.replies = queue.Queue(maxsize=reply_queue)
+        self.pending = None      # (seq, sent, jpeg, recibido) del frame más nuevo sin procesar
+        self.busy = False        # hay un frame suyo en un worker
+        self.closing = False     # el cliente ya no enviará más frames
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.replies_dropped = 0
+        self.finished = threading.Event()  # no quedan respuestas por encolar
+
+
+class RecognitionServer:
+    """
+    Servidor sin pantalla que atiende varios streams de vídeo a la vez con un pool
+    fijo de `workers` procesos, cada uno con su KeypointExtractor y clasificador:
+    - orden por stream: cada stream tiene como mucho un frame en un worker, de modo
+      que sus respuestas salen en el orden de captura;
+    - equidad: cuando queda un worker libre se elige el siguiente stream con frame
+      pendiente en turno rotatorio, sin que un stream rápido acapare el pool;
+    - backpressure: por stream solo se guarda el frame pendiente más nuevo; si llega
+      otro antes de que haya worker, el anterior se descarta (`dropped`), igual que
+      LiveEngine con la webcam. La latencia queda acotada aunque haya sobrecarga.
+    Las respuestas se encolan por stream (cola de `reply_queue`) y las escribe un hilo
+    emisor propio de cada stream, de modo que un cliente lento no frena la entrega
+    de resultados a los demás: si su cola se llena se descarta la respuesta más
+    antigua, y si un envío tarda más de `send_timeout` segundos se cierra el stream.
+    Si un worker muere, los frames que estaban en el pool se descartan y el pool se
+    rehace: los streams siguen atendidos.
+    """
+    def __init__(self, host='127.0.0.1', port=5555, workers=None, model_path=None,
+                 extractor_kwargs=None, metrics=None, reply_queue=8, send_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.reply_queue = reply_queue
+        self.send_timeout = send_timeout
+        self.workers = workers or os.cpu_count() or 1
+        self.metrics = metrics or NullMetrics()
+        if model_path and not os.path.isfile(model_path):
+            print(f"⚠️  No se encontró el modelo {model_path}: se devolverán keypoints sin etiqueta")
+        self._pool_args = (extractor_kwargs, model_path)
+        self._pool = self._new_pool()
+        self._lock = threading.Lock()
+        self._streams = []
+        self._cursor = 0
+        self._in_flight = 0
+        self._next_id = 0
+        self._sock = None
+        self.running = False
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self._pool_args)
+
+    def _submit(self, stream, seq, sent, jpeg):
+        with self._lock:
+            if stream.pending is not None:
+                stream.dropped += 1
+                self.metrics.count('server.dropped')
+            stream.received += 1
+            stream.pending = (seq, sent, jpeg, time.perf_counter())
+            submitted = self._dispatch()
+        self._watch(submitted)
+
+    def _dispatch(self):
+        # Con self._lock tomado: reparte frames mientras haya workers libres. Devuelve
+        # los envíos para _watch, que se llama ya sin el lock
+        submitted = []
+        n = len(self._streams)
+        while self.running and self._in_flight < self.workers and n:
+            for i in range(n):
+                stream = self._streams[(self._cursor + i) % n]
+                if stream.pending is not None and not stream.busy:
+                    break
+            else:
+                break
+            self._cursor = (self._cursor + i + 1) % n
+            seq, sent, jpeg, received = stream.pending
+            stream.pending = None
+            stream.busy = True
+            self._in_flight += 1
+            try:
+                future = self._pool.submit(_recognize, jpeg)
+            except BrokenProcessPool:
+                self._restart_pool(self._pool)
+                future = self._pool.submit(_recognize, jpeg)
+            submitted.append((future, partial(self._done, stream, seq, sent, received, self._pool)))
+        return submitted
+
+    @staticmethod
+    def _watch(submitted):
+        # Si el frame ya terminó, add_done_callback llama a _done en este mismo hilo:
+        # por eso nunca con self._lock tomado
+        for future, callback in submitted:
+            future.add_done_callback(callback)
+
+    def _restart_pool(self, pool):
+        # Con self._lock tomado. Cada frame del pool roto avisa de su fallo: solo el
+        # primero lo rehace
+        if pool is not self._pool:
+            return
+        print("⚠️  Un worker terminó de forma inesperada; se rehace el pool")
+        self.metrics.count('server.pool_restarts')
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._new_pool()
+
+    def _done(self, stream, seq, sent, received, pool, future):
+        # Se ejecuta en el hilo que gestiona el pool, compartido por todos los streams:
+        # solo encola la respuesta, nunca escribe en el socket
+        try:
+            result = future.result()
+            error = None
+        except Exception as e:
+            # El worker murió (BrokenProcessPool) o el frame se canceló al cerrar:
+            # el frame se pierde pero el stream queda libre para el siguiente
+            result, error = None, e
+        with self._lock:
+            stream.busy = False
+            self._in_flight -= 1
+            if error is None:
+                stream.processed += 1
+            else:
+                stream.dropped += 1
+                self.metrics.count('server.failed')
+                if isinstance(error, BrokenProcessPool) and self.running:
+                    self._restart_pool(pool)
+            dropped = stream.dropped
+            submitted = self._dispatch()
+        self._watch(submitted)
+        if error is not None:
+            self._maybe_close(stream)
+            return
+        self.metrics.observe('server.roundtrip', time.perf_counter() - received)
+        self.metrics.count('server.frames')
+        reply = dict(result, stream=stream.id, seq=seq, sent=sent, dropped=dropped)
+        while True:
+            try:
+                stream.replies.put_nowait(reply)
+                break
+            except queue.Full:
+                # Cliente que no lee a tiempo: se pierde su respuesta más antigua
+                try:
+                    stream.replies.get_nowait()
+                    stream.replies_dropped += 1
+                    self.metrics.count('server.replies_dropped')
+                except queue.Empty:
+                    pass
+        self._maybe_close(stream)
+
+    def _send_replies(self, stream):
+        # Hilo emisor del stream: vacía su cola hasta que no queden respuestas
+        while not (stream.finished.is_set() and stream.replies.empty()):
+            try:
+                reply = stream.replies.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                send_reply(stream.sock, reply)
+            except OSError as e:
+                # Incluye el timeout de envío: el cliente no lee y se deja de atender
+                print(f"⚠️  Stream {stream.id}: no se pudo enviar la respuesta ({e}), se cierra")
+                try:
+                    stream.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                break
+        stream.sock.close()
+        print(f"Stream {stream.id} cerrado: {stream.received} frames recibidos, "
+              f"{stream.processed} procesados, {stream.dropped} descartados, "
+              f"{stream.replies_dropped} respuestas descartadas")
+
+    def _maybe_close(self, stream):
+        with self._lock:
+            if not stream.closing or stream.busy or stream.pending is not None or stream not in self._streams:
+                return
+            index = self._streams.index(stream)
+            self._streams.remove(stream)
+            if index < self._cursor:
+                self._cursor -= 1
+            self._cursor = self._cursor % len(self._streams) if self._streams else 0
+            self.metrics.gauge('server.streams', len(self._streams))
+        stream.finished.set()
+
+    def _serve_stream(self, stream):
+        try:
+            while self.running:
+                message = recv_frame(stream.sock)
+                if message is None:
+                    break
+                self._submit(stream, *message)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Stream {stream.id}: {e}")
+        with self._lock:
+            stream.closing = True
+        self._maybe_close(stream)
+
+    def serve_forever(self):
+        self._sock = socket.create_server((self.host, self.port))
+        # accept() con timeout para que Ctrl+C se atienda también en Windows
+        self._sock.settimeout(1.0)
+        self.running = True
+        print(f"Servidor escuchando en {self.host}:{self.port} con {self.workers} workers. Ctrl+C para salir.")
+        try:
+            while self.running:
+                try:
+                    conn, addr = self._sock.accept()
+                except socket.timeout:
+                    continue
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                conn.settimeout(self.send_timeout)
+                with self._lock:
+                    stream = _Stream(self._next_id, conn, self.reply_queue)
+                    self._next_id += 1
+                    self._streams.append(stream)
+                    self.metrics.gauge('server.streams', len(self._streams))
+                print(f"Stream {stream.id} conectado desde {addr[0]}:{addr[1]}")
+                threading.Thread(target=self._serve_stream, args=(stream,),
+                                 name=f'stream-{stream.id}', daemon=True).start()
+                threading.Thread(target=self._send_replies, args=(stream,),
+                                 name=f'stream-{stream.id}-send', daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.running = False
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        with self._lock:
+            streams = list(self._streams)
+        for stream in streams:
+            try:
+                stream.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def replay_stream(host, port, source, duration=None, quality=80, results=None):
+    """
+    Cliente de prueba: envía los frames de `source` (ver sources.open_source) a su
+    ritmo nativo, como una cámara, sin esperar a las respuestas, y recoge en `results`
+    (dict) los frames enviados, respondidos, descartados y la latencia de ida y vuelta.
+    """
+    # Con `duration` los vídeos se repiten hasta agotar el tiempo; sin ella se envían una vez
+    cap = open_source(source, loop=duration is not None)
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    latency = LatencyStats(window=100000)
+    stats = {'sent': 0, 'replies': 0, 'dropped': 0, 'errors': 0, 'labels': {}}
+
+    def receive():
+        while True:
+            try:
+                reply = recv_reply(sock)
+            except OSError:
+                return
+            if reply is None:
+                return
+            latency.add(time.perf_counter() - reply['sent'])
+            stats['replies'] += 1
+            stats['dropped'] = reply['dropped']
+            stats['errors'] += reply['error'] is not None
+            if reply['label'] is not None:
+                stats['labels'][reply['label']] = stats['labels'].get(reply['label'], 0) + 1
+
+    receiver = threading.Thread(target=receive, name='replies', daemon=True)
+    receiver.start()
+    start = time.perf_counter()
+    try:
+        while duration is None or time.perf_counter() - start < duration:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            stats['sent'] += 1
+            send_frame(sock, stats['sent'], time.perf_counter(), jpeg.tobytes())
+    finally:
+        cap.release()
+        # Fin de envío: el servidor termina el frame en curso, responde y cierra
+        sock.shutdown(socket.SHUT_WR)
+        receiver.join(timeout=10.0)
+        sock.close()
+    stats['seconds'] = time.perf_counter() - start
+    stats['latency_p50_ms'], stats['latency_p95_ms'] = [
+        None if v is None else v * 1000 for v in latency.percentiles()]
+    if results is not None:
+        results.update(stats)
+    return stats
+
+
+def run_clients(host, port, source, streams, duration=None, quality=80):
+    """
+    Lanza `streams` clientes replay_stream en paralelo y muestra un resumen por stream.
+    """
+    results = [{} for _ in range(streams)]
+    threads = [threading.Thread(target=replay_stream, args=(host, port, source, duration, quality, r),
+                                name=f'client-{i}') for i, r in enumerate(results)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    fmt = lambda v: f"{v:.1f}" if v is not None else '-'
+    print(f"{'stream':<8}{'enviados':>10}{'respuestas':>12}{'descartados':>13}{'fps':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    for i, r in enumerate(results):
+        if not r:
+            print(f"{i:<8}{'error de conexión':>20}")
+            continue
+        print(f"{i:<8}{r['sent']:>10}{r['replies']:>12}{r['dropped']:>13}{r['replies'] / r['seconds']:>8.1f}"
+              f"{fmt(r['latency_p50_ms']):>10}{fmt(r['latency_p95_ms']):>10}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor de reconocimiento para varios streams de vídeo (sin pantalla).')
+    parser.add_argument('role', choices=('serve', 'client'),
+                        help="'serve' arranca el servidor; 'client' reproduce vídeos contra él")
+    parser.add_argument('--host', default='127.0.0.1', help='Dirección del servidor')
+    parser.add_argument('--port', type=int, default=5555, help='Puerto del servidor')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Procesos de extracción/clasificación')
+    parser.add_argument('--model', default='model.joblib', help='Modelo del clasificador (si no existe, solo keypoints)')
+    parser.add_argument('--max_input_size', type=int, default=None,
+                        help='Reducir los frames a este lado mayor antes de la inferencia')
+    parser.add_argument('--metrics_log', default=None,
+                        help="Añadir métricas periódicas en líneas JSON a este fichero ('-' = stderr)")
+    parser.add_argument('--metrics_interval', type=float, default=5.0, help='Segundos entre exportaciones (0 = solo un resumen al salir)')
+    parser.add_argument('--reply_queue', type=int, default=8, help='Respuestas pendientes máximas por stream')
+    parser.add_argument('--send_timeout', type=float, default=5.0,
+                        help='Segundos máximos por envío antes de cerrar un stream que no lee')
+    parser.add_argument('--source', default='../data/clips', help='Cliente: vídeo, directorio de clips o cámara')
+    parser.add_argument('--streams', type=int, default=2, help='Cliente: número de streams simultáneos')
+    parser.add_argument('--duration', type=float, default=None, help='Cliente: segundos de envío por stream')
+    parser.add_argument('--quality', type=int, default=80, help='Cliente: calidad JPEG de los frames enviados')
+    args = parser.parse_args()
+
+    if args.role == 'client':
+        run_clients(args.host, args.port, args.source, args.streams, args.duration, args.quality)
+    else:
+        metrics = create_metrics(args.metrics_log, interval=args.metrics_interval)
+        server = RecognitionServer(args.host, args.port, args.workers, args.model,
+                                   {'maxInputSize': args.max_input_size}, metrics,
+                                   args.reply_queue, args.send_timeout)
+        try:
+            server.serve_forever()
+        finally:
+            if metrics is not None:
+                metrics.close()
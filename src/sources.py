@@ -0,0 +1,100 @@
+import os
+import time
+
+import cv2
+
+VIDEO_EXTENSIONS = ('.avi', '.mp4', '.mov', '.mkv')
+
+
+class ReplaySource:
+    """
+    Fuente de frames con la interfaz de cv2.VideoCapture (read/isOpened/get/release)
+    que reproduce vídeos a su fps nativo, como si fueran una cámara:
+    - read() espera hasta que "llega" el siguiente frame según el reloj de pared;
+    - si el consumidor va retrasado, los frames que ya pasaron se saltan con grab()
+      sin decodificarlos (`dropped` cuenta los descartados), igual que una webcam
+      que no guarda los frames que nadie leyó.
+    Con `loop=True` la lista de vídeos se repite indefinidamente.
+    Con `realtime=False` los frames se entregan tan rápido como se pidan.
+    """
+    def __init__(self, paths, loop=False, realtime=True, default_fps=20.0):
+        if not paths:
+            raise ValueError("No hay vídeos que reproducir")
+        self.paths = list(paths)
+        self.loop = loop
+        self.realtime = realtime
+        self.default_fps = default_fps
+        self.dropped = 0
+        self._index = -1
+        self._cap = None
+        self._opened = self._next_video()
+
+    def _next_video(self):
+        if self._cap is not None:
+            self._cap.release()
+        self._index += 1
+        if self._index >= len(self.paths):
+            if not self.loop:
+                self._cap = None
+                return False
+            self._index = 0
+        self._cap = cv2.VideoCapture(self.paths[self._index])
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or self.default_fps
+        self._start = time.perf_counter()
+        self._next_frame = 0  # índice del siguiente frame a entregar
+        return self._cap.isOpened()
+
+    def isOpened(self):
+        return self._opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps if self._cap is not None else 0.0
+        return self._cap.get(prop) if self._cap is not None else 0.0
+
+    def read(self):
+        while self._opened:
+            if self.realtime:
+                due = self._start + self._next_frame / self.fps
+                now = time.perf_counter()
+                if now < due:
+                    time.sleep(due - now)
+                else:
+                    # Frames que "llegaron" mientras nadie leía: se descartan sin decodificar
+                    behind = int((now - self._start) * self.fps) - self._next_frame
+                    for _ in range(behind):
+                        if not self._cap.grab():
+                            break
+                        self._next_frame += 1
+                        self.dropped += 1
+            ret, frame = self._cap.read()
+            if ret:
+                self._next_frame += 1
+                return True, frame
+            self._opened = self._next_video()
+        return False, None
+
+    def release(self):
+        self._opened = False
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+def open_source(spec, loop=None, realtime=True):
+    """
+    Abre una fuente de frames a partir de `spec`:
+    - un número ('0', '1', ...): webcam con cv2.VideoCapture;
+    - un fichero de vídeo: se reproduce a su fps nativo (sin repetir salvo `loop=True`);
+    - un directorio: sus vídeos en orden alfabético, en bucle salvo `loop=False`.
+    Todas devuelven un objeto con read()/isOpened()/get()/release().
+    """
+    spec = str(spec)
+    if spec.isdigit():
+        return cv2.VideoCapture(int(spec))
+    if os.path.isdir(spec):
+        paths = [os.path.join(spec, f) for f in sorted(os.listdir(spec)) if f.lower().endswith(VIDEO_EXTENSIONS)]
+        return ReplaySource(paths, loop=True if loop is None else loop, realtime=realtime)
+    if os.path.isfile(spec):
+        return ReplaySource([spec], loop=bool(loop), realtime=realtime)
+    raise ValueError(f"Fuente de vídeo no válida: '{spec}' (usa un índice de cámara, un vídeo o un directorio)")